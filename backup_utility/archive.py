@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+ARCHIVES_FOLDER_NAME = 'archives'
+ARCHIVE_MAGIC = b'BKUPARC1'
+ARCHIVE_BLOCK_SIZE = 1024 * 1024  # Files are compressed in independent blocks of this size
+COMPRESSION_WINDOW = 4  # Blocks of one file being compressed while the next ones are read
+DEFAULT_COMPRESSION_LEVEL = 3
+
+# Formats that are compressed already; their blocks are stored as they are
+COMPRESSED_EXTENSIONS = {
+    '.7z', '.apk', '.avi', '.bz2', '.docx', '.flac', '.gif', '.gz', '.heic', '.jar', '.jpeg', '.jpg', '.lz4',
+    '.m4a', '.mkv', '.mov', '.mp3', '.mp4', '.ogg', '.pdf', '.png', '.pptx', '.rar', '.tgz', '.webm', '.webp',
+    '.xlsx', '.xz', '.zip', '.zst',
+}
+
+
+class ArchiveStore:
+    # Each run appends the files that changed to a new archive under archives/. Files
+    # are split into blocks compressed with zlib on a thread pool (zlib releases the
+    # GIL), so compression runs on several cores and overlaps with reading the source.
+    # The catalog maps every file to the archive and blocks holding its latest version.
+    def __init__(self, destination_folder, level=DEFAULT_COMPRESSION_LEVEL, workers=1):
+        self.path = os.path.join(destination_folder, ARCHIVES_FOLDER_NAME)
+        self.catalog_path = os.path.join(self.path, 'catalog.json')
+        self.level = level
+        self.archive_file = None
+        self.offset = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.archive_name = self.new_archive_name()
+        self.catalog = {}
+        if os.path.exists(self.catalog_path):
+            with open(self.catalog_path, 'r') as f:
+                self.catalog = json.load(f)
+
+    def new_archive_name(self):
+        stem = time.strftime('backup-%Y%m%d-%H%M%S')
+        name = f"{stem}.arc"
+        number = 1
+        while os.path.exists(os.path.join(self.path, name)):
+            number += 1
+            name = f"{stem}-{number}.arc"
+        return name
+
+    def is_unchanged(self, key, file_stat):
+        entry = self.catalog.get(key)
+        return entry is not None and entry['size'] == file_stat.st_size and entry['mtime_ns'] == file_stat.st_mtime_ns
+
+    def store_file(self, key, file_path, file_stat, on_stored):
+        compress = os.path.splitext(file_path)[1].lower() not in COMPRESSED_EXTENSIONS
+        blocks = []
+        stored_size = 0
+        in_flight = deque()
+        with open(file_path, 'rb') as f:
+            while True:
+                data = f.read(ARCHIVE_BLOCK_SIZE)
+                if data:
+                    in_flight.append((len(data), self.executor.submit(self.pack_block, data, compress)))
+                if in_flight and (not data or len(in_flight) >= COMPRESSION_WINDOW):
+                    # Blocks are appended in order, while the ones behind them are still compressing
+                    raw_length, future = in_flight.popleft()
+                    packed, compressed = future.result()
+                    blocks.append([self.append(packed), len(packed), raw_length, compressed])
+                    stored_size += len(packed)
+                    on_stored(raw_length)
+                elif not data:
+                    break
+
+        with self.lock:
+            self.catalog[key] = {'archive': self.archive_name, 'size': file_stat.st_size,
+                                 'mtime_ns': file_stat.st_mtime_ns, 'blocks': blocks}
+        return f"{stored_size * 100 // max(1, file_stat.st_size)}% of original size"
+
+    def pack_block(self, data, compress):
+        if compress:
+            packed = zlib.compress(data, self.level)
+            if len(packed) < len(data):
+                return packed, 1
+        return data, 0
+
+    def append(self, data):
+        with self.lock:
+            if self.archive_file is None:
+                os.makedirs(self.path, exist_ok=True)
+                self.archive_file = open(os.path.join(self.path, self.archive_name), 'xb')
+                self.archive_file.write(ARCHIVE_MAGIC)
+                self.offset = len(ARCHIVE_MAGIC)
+            offset = self.offset
+            self.archive_file.write(data)
+            self.offset += len(data)
+        return offset
+
+    def restore_file(self, key, target_path, on_restored):
+        # Mirrors store_file: blocks are decompressed on the pool while the next ones are read
+        entry = self.catalog[key]
+        blocks = iter(entry['blocks'])
+        in_flight = deque()
+        with open(os.path.join(self.path, entry['archive']), 'rb') as archive, open(target_path, 'wb') as f:
+            while True:
+                block = next(blocks, None)
+                if block is not None:
+                    offset, length, _, compressed = block
+                    archive.seek(offset)
+                    in_flight.append(self.executor.submit(self.unpack_block, archive.read(length), compressed))
+                if in_flight and (block is None or len(in_flight) >= COMPRESSION_WINDOW):
+                    data = in_flight.popleft().result()
+                    f.write(data)
+                    on_restored(len(data))
+                elif block is None:
+                    break
+        os.utime(target_path, ns=(entry['mtime_ns'], entry['mtime_ns']))
+
+    def unpack_block(self, data, compressed):
+        return zlib.decompress(data) if compressed else data
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def save(self):
+        self.close()
+        with self.lock:
+            if self.archive_file is None:
+                return  # Nothing changed, so no archive and no catalog update
+            self.archive_file.flush()
+            os.fsync(self.archive_file.fileno())  # The catalog must never point past what is on disk
+            self.archive_file.close()
+            self.archive_file = None
+            temp_path = self.catalog_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(self.catalog, f)
+            os.replace(temp_path, self.catalog_path)
+
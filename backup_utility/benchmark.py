@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .copying import DEFAULT_BUFFER_SIZE_MB
+from .engine import BackupEngine, DEFAULT_WORKERS, MODE_MIRROR, MODES
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# name: (folders, files per folder, file size, nested, scale file size rather than folder count)
+SCENARIOS = {
+    'tiny': (100, 100, 1024, False, False),  # 10,000 files of 1 KB
+    'huge': (1, 4, 64 * 1024 * 1024, False, True),  # 4 files of 64 MB
+    'deep': (200, 10, 4096, True, False),  # 200 folders nested inside each other
+    'mixed': None,  # One of each of the above, scaled down
+}
+MIXED_PARTS = {'tiny': 0.2, 'huge': 0.25, 'deep': 0.25}
+COUNTED_CALLS = ('stat', 'lstat', 'scandir', 'mkdir', 'replace')
+
+
+def generate_tree(root, scenario, scale):
+    if scenario == 'mixed':
+        for part, part_scale in MIXED_PARTS.items():
+            generate_tree(os.path.join(root, part), part, scale * part_scale)
+        return
+
+    folders, files_per_folder, file_size, nested, scale_size = SCENARIOS[scenario]
+    if scale_size:
+        file_size = max(1, int(file_size * scale))
+    else:
+        folders = max(1, int(folders * scale))
+    block = os.urandom(min(file_size, 1024 * 1024))
+    folder = root
+    for folder_number in range(folders):
+        folder = os.path.join(folder if nested else root, f"folder{folder_number}")
+        os.makedirs(folder, exist_ok=True)
+        for file_number in range(files_per_folder):
+            with open(os.path.join(folder, f"file{file_number}.bin"), 'wb') as f:
+                remaining = file_size
+                while remaining:
+                    f.write(block[:remaining])
+                    remaining -= min(remaining, len(block))
+
+
+def io_counters():
+    # Read/write syscall counts of this process, where the platform exposes them
+    counters = {}
+    try:
+        with open('/proc/self/io', 'r') as f:
+            for line in f:
+                name, value = line.split(':')
+                counters[name] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+def count_os_calls():
+    # Wraps the os functions the engine uses so the Python-level calls can be counted
+    counts = dict.fromkeys(COUNTED_CALLS, 0)
+
+    def counted(name, function):
+        def wrapper(*args, **kwargs):
+            counts[name] += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    for name in COUNTED_CALLS:
+        setattr(os, name, counted(name, getattr(os, name)))
+    return counts
+
+
+def run_backup(source, destination, settings):
+    # Runs in a fresh child process so the peak memory belongs to this run only
+    counts = count_os_calls()
+    io_before = io_counters()
+    start = time.perf_counter()
+    outcomes = BackupEngine([source], destination, **settings).run()
+    elapsed = time.perf_counter() - start
+    io_after = io_counters()
+
+    result = {'seconds': round(elapsed, 3), 'outcomes': outcomes, 'os_calls': counts}
+    if io_after:
+        result['read_syscalls'] = io_after['syscr'] - io_before['syscr']
+        result['write_syscalls'] = io_after['syscw'] - io_before['syscw']
+        result['bytes_written'] = io_after['wchar'] - io_before['wchar']
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result['peak_memory_mb'] = round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    return result
+
+
+def tree_size(root):
+    files = 0
+    size = 0
+    for folder, _, names in os.walk(root):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(folder, name))
+    return files, size
+
+
+def benchmark_scenario(workdir, scenario, scale, settings):
+    source = os.path.join(workdir, scenario, 'source')
+    destination = os.path.join(workdir, scenario, 'destination')
+    generate_tree(source, scenario, scale)
+    os.makedirs(destination)
+    files, size = tree_size(source)
+
+    results = {'files': files, 'bytes': size}
+    for run in ('full', 'incremental'):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_backup, source, destination, settings).result()
+        seconds = max(result['seconds'], 1e-6)
+        result['files_per_second'] = round(files / seconds, 1)
+        result['mb_per_second'] = round(size / seconds / (1024 * 1024), 1)
+        results[run] = result
+    shutil.rmtree(os.path.join(workdir, scenario))
+    return results
+
+
+def compare(results, baseline):
+    for scenario, scenario_results in results['scenarios'].items():
+        baseline_results = baseline['scenarios'].get(scenario)
+        if not baseline_results:
+            continue
+        for run in ('full', 'incremental'):
+            before = baseline_results[run]['seconds']
+            after = scenario_results[run]['seconds']
+            change = (after - before) / before * 100 if before else 0
+            print(f"{scenario:>6} {run:<11} {before:8.3f}s -> {after:8.3f}s ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m backup_utility.benchmark',
+                                     description="Benchmark the backup engine on synthetic source trees.")
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplies the number or size of files")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--mode', choices=list(MODES), default=MODE_MIRROR)
+    parser.add_argument('--buffer-size-mb', type=int, default=DEFAULT_BUFFER_SIZE_MB)
+    parser.add_argument('--pack-threshold-kb', type=int, default=0, help="pack mirror files smaller than this")
+    parser.add_argument('--workdir', help="where trees are generated (default: a temporary folder)")
+    parser.add_argument('--output', help="save results as JSON")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+
+    settings = {'workers': args.workers, 'mode': args.mode, 'log_skipped': False,
+                'buffer_size_mb': args.buffer_size_mb, 'pack_threshold_kb': args.pack_threshold_kb}
+    workdir = tempfile.mkdtemp(prefix='backup-benchmark-', dir=args.workdir)
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': args.scale,
+        'settings': settings,
+        'scenarios': {}
+    }
+    try:
+        for scenario in args.scenarios or list(SCENARIOS):
+            scenario_results = benchmark_scenario(workdir, scenario, args.scale, settings)
+            results['scenarios'][scenario] = scenario_results
+            for run in ('full', 'incremental'):
+                result = scenario_results[run]
+                print(f"{scenario:>6} {run:<11} {scenario_results['files']:>7} files "
+                      f"{result['seconds']:8.3f}s {result['files_per_second']:>10.1f} files/s "
+                      f"{result['mb_per_second']:>8.1f} MB/s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
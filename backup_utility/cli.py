@@ -0,0 +1,359 @@
+import argparse
+import json
+import os
+import sys
+import threading
+
+from .config import (
+    CONFIG_FILE_NAME, DEFAULT_PROFILE, continuous_settings, engine_settings, journal_file, load_config, load_profiles
+)
+from .continuous import ContinuousBackup
+from .engine import MODE_SNAPSHOT, BackupEngine
+from .journal import JOURNAL_FILE_NAME, JournalWatcher, journal_supported
+from .planning import load_plan, plan_summary, save_plan
+from .progress import format_duration
+from .logs import LOG_FILE_NAME, setup_logging, stop_logging
+from .restore import RestoreEngine
+from .retention import SnapshotPruner, parse_retention
+from .scheduler import DEFAULT_MAX_PER_DESTINATION, BackupScheduler
+from .snapshots import SNAPSHOTS_FOLDER_NAME, list_snapshots
+
+
+SETTINGS_POLL_SECONDS = 5  # How often a running backup looks for a new speed limit in the settings file
+
+
+class ConsoleProgress:
+    # Keeps a single status line up to date on a terminal, or prints plain lines otherwise
+    def __init__(self, stream):
+        self.stream = stream
+        self.interactive = stream.isatty()
+        self.progress = 0
+        self.throughput = ""
+
+    def update_progress(self, progress):
+        self.progress = progress
+
+    def update_throughput(self, megabytes_per_second, eta_seconds):
+        eta = format_duration(eta_seconds) if eta_seconds >= 0 else "unknown"
+        self.throughput = f"{megabytes_per_second:.1f} MB/s, ETA {eta}"
+
+    def update_status(self, status):
+        line = f"{self.progress:3d}% {self.throughput} | {status}"
+        if self.interactive:
+            self.stream.write(f"\r\033[K{line}")
+        else:
+            self.stream.write(f"{line}\n")
+        self.stream.flush()
+
+    def finish(self):
+        if self.interactive:
+            self.stream.write("\n")
+
+
+def read_config(args):
+    # The profile chosen with --profile, or None after printing why it could not be read
+    try:
+        return load_config(args.config, args.profile)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return None
+
+
+def backup_engine(args, console, plan=None, journal_path=JOURNAL_FILE_NAME, continuous=False):
+    # The engine for the settings file, or None after printing why there is nothing to back up.
+    # A continuous backup stands in for the engine when continuous is set.
+    config = read_config(args)
+    if config is None:
+        return None
+    if not config['destination_folder']:
+        print(f"No destination folder set in {args.config}", file=sys.stderr)
+        return None
+    if not config['items']:
+        print(f"No files or folders to back up in {args.config}", file=sys.stderr)
+        return None
+    if plan is not None and (plan['destination_folder'], plan['mode']) != (config['destination_folder'],
+                                                                           config['mode']):
+        print(f"The plan was made for another destination or destination mode than {args.config}", file=sys.stderr)
+        return None
+    callbacks = {'on_progress': console and console.update_progress,
+                 'on_throughput': console and console.update_throughput,
+                 'on_status': console and console.update_status}
+    try:
+        if continuous:
+            return ContinuousBackup(config['items'], config['destination_folder'], **continuous_settings(config),
+                                    journal_file=journal_path, **engine_settings(config), **callbacks)
+        return BackupEngine(config['items'], config['destination_folder'], **engine_settings(config), plan=plan,
+                            journal_file=journal_path, **callbacks)
+    except ValueError as e:
+        print(f"{e} in {args.config}", file=sys.stderr)
+        return None
+
+
+def follow_throttle(args, engine, throttle):
+    # Applies the speed limit saved in the settings file while the backup runs, so it can be raised
+    # or lowered without restarting; returns the event that stops following
+    stopped = threading.Event()
+
+    def follow():
+        nonlocal throttle
+        try:
+            modified = os.stat(args.config).st_mtime_ns
+        except OSError:
+            modified = None
+        while not stopped.wait(SETTINGS_POLL_SECONDS):
+            try:
+                current = os.stat(args.config).st_mtime_ns
+            except OSError:
+                continue
+            if current == modified:
+                continue
+            modified = current
+            config = read_config(args)
+            if config is None or config['throttle'] == throttle:
+                continue
+            try:
+                engine.set_throttle(config['throttle'])
+                throttle = config['throttle']
+            except ValueError as e:
+                print(f"{e} in {args.config}, keeping the speed limit {throttle or 'unlimited'}", file=sys.stderr)
+
+    threading.Thread(target=follow, daemon=True).start()
+    return stopped
+
+
+def run_backup(args):
+    if args.plan and args.continuous:
+        print("--plan cannot be combined with --continuous", file=sys.stderr)
+        return 2
+    plan = load_plan(args.plan) if args.plan else None
+    console = None if args.quiet else ConsoleProgress(sys.stdout)
+    engine = backup_engine(args, console, plan, args.journal or journal_file(args.profile), args.continuous)
+    if engine is None:
+        return 2
+    log_listener = setup_logging(args.log)
+    following = follow_throttle(args, engine, read_config(args)['throttle'])
+    try:
+        try:
+            outcomes = engine.run()
+        except KeyboardInterrupt:
+            if not args.continuous:
+                raise
+            outcomes = engine.outcomes  # How continuous backups normally end
+        except RuntimeError as e:
+            if not args.continuous:
+                raise
+            print(e, file=sys.stderr)
+            return 1
+    finally:
+        following.set()
+        stop_logging(log_listener)
+        if console:
+            console.finish()
+    return 1 if outcomes['failed'] or outcomes['mismatched'] else 0
+
+
+def run_plan(args):
+    console = None if args.quiet else ConsoleProgress(sys.stderr)
+    engine = backup_engine(args, console)
+    if engine is None:
+        return 2
+    try:
+        plan = engine.make_plan()
+    finally:
+        if console:
+            console.finish()
+    if args.output:
+        save_plan(plan, args.output)
+    else:
+        json.dump(plan, sys.stdout, indent=2)
+        print()
+    if not args.quiet:
+        print(plan_summary(plan), file=sys.stderr)
+    return 0
+
+
+def run_watch(args):
+    config = read_config(args)
+    if config is None:
+        return 2
+    if not journal_supported():
+        print("Watching for changes needs Linux (inotify)", file=sys.stderr)
+        return 2
+    if not any(os.path.isdir(item) for item in config['items']):
+        print(f"No folders to watch in {args.config}", file=sys.stderr)
+        return 2
+
+    watcher = JournalWatcher(config['items'], args.journal or journal_file(args.profile),
+                             on_status=None if args.quiet else print)
+    log_listener = setup_logging(args.log)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    except (OSError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        stop_logging(log_listener)
+    return 0
+
+
+def run_restore(args):
+    config = read_config(args)
+    if config is None:
+        return 2
+    if not config['destination_folder']:
+        print(f"No destination folder set in {args.config}", file=sys.stderr)
+        return 2
+    if args.snapshot:
+        snapshots = list_snapshots(os.path.join(config['destination_folder'], SNAPSHOTS_FOLDER_NAME))
+        if config['mode'] != MODE_SNAPSHOT or args.snapshot not in snapshots:
+            print(f"No snapshot {args.snapshot}; available: {', '.join(snapshots) or 'none'}", file=sys.stderr)
+            return 2
+
+    console = None if args.quiet else ConsoleProgress(sys.stdout)
+    engine = RestoreEngine(config['destination_folder'], config['items'], args.to, args.include,
+                           workers=config['workers'], mode=config['mode'], buffer_size_mb=config['buffer_size_mb'],
+                           snapshot=args.snapshot,
+                           on_progress=console and console.update_progress,
+                           on_throughput=console and console.update_throughput,
+                           on_status=console and console.update_status)
+    log_listener = setup_logging(args.log)
+    try:
+        outcomes = engine.run()
+    finally:
+        stop_logging(log_listener)
+        if console:
+            console.finish()
+    return 1 if outcomes['failed'] else 0
+
+
+def run_prune(args):
+    config = read_config(args)
+    if config is None:
+        return 2
+    if not config['destination_folder']:
+        print(f"No destination folder set in {args.config}", file=sys.stderr)
+        return 2
+    try:
+        policy = parse_retention(config['retention'] if args.keep is None else args.keep)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if not policy:
+        print(f"No retention policy in {args.config}, set one with --keep", file=sys.stderr)
+        return 2
+
+    pruner = SnapshotPruner(config['destination_folder'], policy, config['workers'],
+                            on_status=None if args.quiet else print)
+    if args.dry_run:
+        for name in pruner.plan():
+            print(f"Would prune {name}")
+        for name in pruner.abandoned():
+            print(f"Would delete unfinished snapshot {name}")
+        return 0
+    log_listener = setup_logging(args.log)
+    try:
+        pruned = pruner.run()
+    finally:
+        stop_logging(log_listener)
+    if not args.quiet:
+        print(f"Pruned {len(pruned)} snapshots")
+    return 0
+
+
+def run_schedule(args):
+    try:
+        scheduler = BackupScheduler(load_profiles(args.config), args.per_destination,
+                                    on_status=None if args.quiet else print)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if not scheduler.schedules:
+        print(f"No profile in {args.config} has a schedule", file=sys.stderr)
+        return 2
+
+    log_listener = setup_logging(args.log)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        pass  # Backups that already started are finished first
+    finally:
+        stop_logging(log_listener)
+    return 0
+
+
+def add_config_arguments(parser):
+    parser.add_argument('--config', default=CONFIG_FILE_NAME,
+                        help=f"settings file written by the GUI (default: {CONFIG_FILE_NAME})")
+    parser.add_argument('--profile', default=DEFAULT_PROFILE,
+                        help=f"backup profile in the settings file (default: {DEFAULT_PROFILE})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='backup-utility', description="Run backups without the GUI.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="back up the items saved in a settings file")
+    add_config_arguments(run_parser)
+    run_parser.add_argument('--log', default=LOG_FILE_NAME, help=f"log file (default: {LOG_FILE_NAME})")
+    run_parser.add_argument('--quiet', action='store_true', help="do not print progress")
+    run_parser.add_argument('--plan', metavar='FILE', help="back up the files listed in a plan instead of walking "
+                                                           "the items again")
+    run_parser.add_argument('--continuous', action='store_true',
+                            help="keep watching the items after the backup and back up changed files as they settle, "
+                                 "until interrupted (Linux)")
+    run_parser.add_argument('--journal', help=f"change journal used when change_journal is on "
+                                              f"(default: {JOURNAL_FILE_NAME}, or one per profile)")
+    run_parser.set_defaults(handler=run_backup)
+
+    watch_parser = subparsers.add_parser('watch', help="record changed files until interrupted, so runs with "
+                                                       "change_journal on only back up those")
+    add_config_arguments(watch_parser)
+    watch_parser.add_argument('--journal', help=f"change journal to record to (default: {JOURNAL_FILE_NAME}, "
+                                                f"or one per profile)")
+    watch_parser.add_argument('--log', default=LOG_FILE_NAME, help=f"log file (default: {LOG_FILE_NAME})")
+    watch_parser.add_argument('--quiet', action='store_true', help="do not print status messages")
+    watch_parser.set_defaults(handler=run_watch)
+
+    plan_parser = subparsers.add_parser('plan', help="show what a run would do without changing the destination")
+    add_config_arguments(plan_parser)
+    plan_parser.add_argument('--output', metavar='FILE', help="save the plan as JSON (default: print it)")
+    plan_parser.add_argument('--quiet', action='store_true', help="do not print progress and totals")
+    plan_parser.set_defaults(handler=run_plan)
+
+    restore_parser = subparsers.add_parser('restore', help="restore files from the destination in a settings file")
+    add_config_arguments(restore_parser)
+    restore_parser.add_argument('--to', metavar='FOLDER',
+                                help="restore below this folder instead of to the original locations")
+    restore_parser.add_argument('--include', action='append', default=[], metavar='PATTERN',
+                                help="only restore paths or folders matching this pattern, e.g. 'Documents/*.docx' "
+                                     "(may be repeated)")
+    restore_parser.add_argument('--snapshot', metavar='NAME',
+                                help="in snapshot mode, the snapshot to restore (default: the latest)")
+    restore_parser.add_argument('--log', default=LOG_FILE_NAME, help=f"log file (default: {LOG_FILE_NAME})")
+    restore_parser.add_argument('--quiet', action='store_true', help="do not print progress")
+    restore_parser.set_defaults(handler=run_restore)
+
+    prune_parser = subparsers.add_parser('prune', help="delete the snapshots the retention policy does not keep")
+    add_config_arguments(prune_parser)
+    prune_parser.add_argument('--keep', metavar='POLICY',
+                              help="retention policy instead of the saved one, e.g. 'last=5 daily=7 monthly=12'")
+    prune_parser.add_argument('--dry-run', action='store_true', help="only list the snapshots that would be pruned")
+    prune_parser.add_argument('--log', default=LOG_FILE_NAME, help=f"log file (default: {LOG_FILE_NAME})")
+    prune_parser.add_argument('--quiet', action='store_true', help="do not print progress")
+    prune_parser.set_defaults(handler=run_prune)
+
+    schedule_parser = subparsers.add_parser('schedule', help="back up the profiles with a schedule whenever they "
+                                                             "are due, until interrupted")
+    schedule_parser.add_argument('--config', default=CONFIG_FILE_NAME,
+                                 help=f"settings file written by the GUI (default: {CONFIG_FILE_NAME})")
+    schedule_parser.add_argument('--per-destination', type=int, default=DEFAULT_MAX_PER_DESTINATION, metavar='N',
+                                 help="backups run at once to destinations on the same device "
+                                      f"(default: {DEFAULT_MAX_PER_DESTINATION})")
+    schedule_parser.add_argument('--log', default=LOG_FILE_NAME, help=f"log file (default: {LOG_FILE_NAME})")
+    schedule_parser.add_argument('--quiet', action='store_true', help="do not print status messages")
+    schedule_parser.set_defaults(handler=run_schedule)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
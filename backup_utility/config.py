@@ -0,0 +1,94 @@
+import json
+import os
+import re
+
+from .archive import DEFAULT_COMPRESSION_LEVEL
+from .continuous import DEFAULT_DEBOUNCE_SECONDS, DEFAULT_MAX_LAG_SECONDS
+from .copying import DEFAULT_BUFFER_SIZE_MB
+from .engine import COMPARE_METADATA, DEFAULT_WORKERS, DELETIONS_KEEP, MODE_MIRROR
+from .journal import JOURNAL_FILE_NAME
+
+
+CONFIG_FILE_NAME = 'backup_data.json'
+DEFAULT_PROFILE = 'Default'  # Kept at the top level of the settings file, where settings were before profiles
+
+# Engine settings saved next to the items and destination, with their defaults
+SETTINGS_DEFAULTS = {
+    'workers': DEFAULT_WORKERS,
+    'mode': MODE_MIRROR,
+    'log_skipped': True,
+    'buffer_size_mb': DEFAULT_BUFFER_SIZE_MB,
+    'compare': COMPARE_METADATA,
+    'verify': False,
+    'compression_level': DEFAULT_COMPRESSION_LEVEL,
+    'pack_threshold_kb': 0,
+    'delta_threshold_mb': 0,
+    'retention': '',
+    'deletions': DELETIONS_KEEP,
+    'change_journal': False,
+    'throttle': '',
+    'low_priority': False,
+}
+
+# Continuous backup settings, saved with the engine settings
+CONTINUOUS_DEFAULTS = {
+    'debounce_seconds': DEFAULT_DEBOUNCE_SECONDS,
+    'max_lag_seconds': DEFAULT_MAX_LAG_SECONDS,
+}
+
+
+def profile_config(data):
+    config = {
+        'items': data.get('items', []),
+        'destination_folder': data.get('destination_folder', ''),
+        'schedule': data.get('schedule', '')  # When the scheduler backs the profile up, see scheduler.parse_schedule
+    }
+    for key, default in list(SETTINGS_DEFAULTS.items()) + list(CONTINUOUS_DEFAULTS.items()):
+        config[key] = data.get(key, default)
+    return config
+
+
+def load_profiles(path=CONFIG_FILE_NAME):
+    # Every profile by name: DEFAULT_PROFILE at the top level of the file, the others below 'profiles'
+    data = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+
+    profiles = {DEFAULT_PROFILE: profile_config(data)}
+    for name, profile_data in data.get('profiles', {}).items():
+        profiles[name] = profile_config(profile_data)
+    return profiles
+
+
+def load_config(path=CONFIG_FILE_NAME, profile=DEFAULT_PROFILE):
+    profiles = load_profiles(path)
+    if profile not in profiles:
+        raise ValueError(f"No profile {profile} in {path} (available: {', '.join(profiles)})")
+    return profiles[profile]
+
+
+def save_profiles(profiles, path=CONFIG_FILE_NAME):
+    data = dict(profiles[DEFAULT_PROFILE])
+    other_profiles = {name: config for name, config in profiles.items() if name != DEFAULT_PROFILE}
+    if other_profiles:
+        data['profiles'] = other_profiles
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def journal_file(profile=DEFAULT_PROFILE):
+    # Every profile has its own change journal, as each needs its own watcher
+    if profile == DEFAULT_PROFILE:
+        return JOURNAL_FILE_NAME
+    stem, extension = os.path.splitext(JOURNAL_FILE_NAME)
+    safe_name = re.sub(r'[^\w.-]', '_', profile)
+    return f"{stem}-{safe_name}{extension}"
+
+
+def engine_settings(config):
+    return {key: config[key] for key in SETTINGS_DEFAULTS}
+
+
+def continuous_settings(config):
+    return {key: config[key] for key in CONTINUOUS_DEFAULTS}
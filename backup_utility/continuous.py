@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+
+from .engine import MODE_SNAPSHOT, BackupEngine
+from .journal import JOURNAL_FILE_NAME, JournalWatcher, journal_supported
+
+
+DEFAULT_DEBOUNCE_SECONDS = 10  # Quiet time after the last change before the changed files are backed up
+DEFAULT_MAX_LAG_SECONDS = 300  # Longest a change waits for the backup while files keep changing
+POLL_INTERVAL = 1.0  # Seconds between checks whether a backup is due
+
+
+class ContinuousBackup:
+    # Backs up the items once, then watches them and backs up only the changed files whenever the
+    # changes settled for debounce_seconds, or max_lag_seconds after the first change at the latest.
+    # A file changed many times in between is backed up once. Runs until stop() is called; the
+    # remaining settings and the callbacks are passed to every BackupEngine run.
+    def __init__(self, items, destination_folder, debounce_seconds=DEFAULT_DEBOUNCE_SECONDS,
+                 max_lag_seconds=DEFAULT_MAX_LAG_SECONDS, journal_file=JOURNAL_FILE_NAME,
+                 on_progress=None, on_throughput=None, on_status=None, **settings):
+        if not journal_supported():
+            raise ValueError("Continuous backup needs Linux (inotify)")
+        if settings.get('mode') == MODE_SNAPSHOT:
+            raise ValueError("Continuous backup is not available in snapshots mode, which copies or links every "
+                             "file on each run")
+        self.items = items
+        self.destination_folder = destination_folder
+        self.debounce = debounce_seconds
+        self.max_lag = max(max_lag_seconds, debounce_seconds)
+        self.journal_file = journal_file
+        self.settings = dict(settings, change_journal=True)
+        self.callbacks = {'on_progress': on_progress, 'on_throughput': on_throughput, 'on_status': on_status}
+        self.on_status = on_status or (lambda message: None)
+        self.changed = threading.Condition()
+        self.first_change = None  # When the oldest change not backed up yet was recorded
+        self.last_change = None
+        self.retry_at = None  # When to back up again after a run that did not finish everything
+        self.stop_event = threading.Event()
+        self.engine = self.new_engine()  # Created here, so invalid settings raise before anything runs
+        self.outcomes = dict.fromkeys(self.engine.outcomes, 0)  # Totals over all runs
+
+    def new_engine(self):
+        return BackupEngine(self.items, self.destination_folder, journal_file=self.journal_file, **self.settings,
+                            **self.callbacks)
+
+    def stop(self):
+        self.stop_event.set()
+        with self.changed:
+            self.changed.notify()
+
+    def set_throttle(self, throttle):
+        self.engine.set_throttle(throttle)
+        self.settings['throttle'] = throttle  # For the following runs
+
+    def on_recorded(self):
+        now = time.monotonic()
+        with self.changed:
+            if self.first_change is None:
+                self.first_change = now
+            self.last_change = now
+            self.changed.notify()
+
+    def run(self):
+        watcher = JournalWatcher(self.items, self.journal_file, on_status=self.on_status,
+                                 on_recorded=self.on_recorded)
+        watcher.start()
+        try:
+            while not watcher.ready.wait(POLL_INTERVAL):
+                if not watcher.thread.is_alive():
+                    raise RuntimeError("Could not watch the items for changes, see the log")
+            self.backup()  # Walks all items, after which the journal covers every change
+            while not self.stop_event.is_set():
+                if not watcher.thread.is_alive():
+                    raise RuntimeError("Stopped watching for changes, see the log")
+                with self.changed:
+                    self.changed.wait(POLL_INTERVAL)
+                    due = self.is_due(time.monotonic())
+                    if due:
+                        self.first_change = self.last_change = self.retry_at = None
+                if due and not self.stop_event.is_set():
+                    self.engine = self.new_engine()
+                    self.backup()
+        finally:
+            watcher.stop()
+        self.on_status("Continuous backup stopped")
+        logging.info("Continuous backup stopped")
+        return self.outcomes
+
+    def is_due(self, now):
+        if self.retry_at is not None and now >= self.retry_at:
+            return True
+        if self.first_change is None:
+            return False
+        return now - self.last_change >= self.debounce or now - self.first_change >= self.max_lag
+
+    def backup(self):
+        try:
+            outcomes = self.engine.run()
+        except Exception as e:
+            self.on_status(f"Backup failed ({e}), retrying in {self.max_lag} seconds")
+            logging.warning(f"Backup failed ({e}), retrying in {self.max_lag} seconds")
+            self.retry_at = time.monotonic() + self.max_lag
+            return
+        for outcome, count in outcomes.items():
+            self.outcomes[outcome] += count
+        if outcomes['failed'] or outcomes['mismatched']:
+            # The failed files are still in the journal, but nothing may change them again
+            self.retry_at = time.monotonic() + self.max_lag
+        self.on_status(f"Backed up at {time.strftime('%H:%M:%S')}, watching for changes | {self.engine.summary()}")
@@ -0,0 +1,110 @@
+import errno
+import os
+import shutil
+import sys
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+DEFAULT_BUFFER_SIZE_MB = 4  # Bytes moved per call, and between progress updates
+PARTIAL_COPY_SUFFIX = '.backup-partial'  # Copies are written under this name and renamed once complete
+FICLONE = 0x40049409  # Linux ioctl sharing the source's extents with the destination (btrfs, XFS)
+
+# Errors meaning "this backend cannot copy between these files", not "the copy failed"
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.ENOTTY, errno.EOPNOTSUPP, errno.EBADF}
+
+
+class FileCopier:
+    # Copies file contents with the cheapest backend the platform and filesystems
+    # allow: reflink, then os.copy_file_range, then os.sendfile, and finally a
+    # readinto loop over a reusable per-thread buffer. Metadata is copied like shutil.copy2.
+    # Passing a digest forces the readinto loop so the data is hashed on its way through.
+    # An interrupted copy never replaces the previous copy of the file with a truncated one.
+    def __init__(self, buffer_size_mb=DEFAULT_BUFFER_SIZE_MB):
+        self.buffer_size = max(1, buffer_size_mb) * 1024 * 1024
+        self.local = threading.local()
+
+    def copy(self, src, dst, on_copied, digest=None):
+        partial = dst + PARTIAL_COPY_SUFFIX
+        try:
+            with open(src, 'rb', buffering=0) as fsrc, open(partial, 'wb', buffering=0) as fdst:
+                if digest is not None or not (self.reflink(fsrc, fdst, on_copied)
+                                              or self.copy_kernel(copy_file_range, fsrc, fdst, on_copied)
+                                              or self.copy_kernel(sendfile, fsrc, fdst, on_copied)):
+                    self.copy_buffered(fsrc, fdst, on_copied, digest)
+            shutil.copystat(src, partial)
+            os.replace(partial, dst)
+        except BaseException:
+            remove_partial(dst)
+            raise
+
+    def reflink(self, fsrc, fdst, on_copied):
+        if fcntl is None or not sys.platform.startswith('linux'):
+            return False
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError as e:
+            if e.errno in UNSUPPORTED_ERRNOS:
+                return False
+            raise
+        on_copied(os.fstat(fsrc.fileno()).st_size)
+        return True
+
+    def copy_kernel(self, copy_range, fsrc, fdst, on_copied):
+        if copy_range is None:
+            return False
+        offset = 0
+        while True:
+            try:
+                length = copy_range(fsrc.fileno(), fdst.fileno(), offset, self.buffer_size)
+            except OSError as e:
+                if offset == 0 and e.errno in UNSUPPORTED_ERRNOS:
+                    return False
+                raise
+            if not length:
+                return True
+            offset += length
+            on_copied(length)
+
+    def copy_buffered(self, fsrc, fdst, on_copied, digest=None):
+        view = getattr(self.local, 'view', None)
+        if view is None or len(view) != self.buffer_size:
+            view = self.local.view = memoryview(bytearray(self.buffer_size))
+        fsrc.seek(0)
+        fdst.seek(0)
+        fdst.truncate()
+        while True:
+            length = fsrc.readinto(view)
+            if not length:
+                break
+            if digest is not None:
+                digest.update(view[:length])
+            written = 0
+            while written < length:
+                written += fdst.write(view[written:length])
+            on_copied(length)
+
+
+def remove_partial(dst):
+    # Removes what an unfinished copy to dst left behind
+    try:
+        os.remove(dst + PARTIAL_COPY_SUFFIX)
+    except OSError:
+        pass  # Never written, or the destination is unavailable and the next run overwrites it
+
+
+if hasattr(os, 'copy_file_range'):
+    def copy_file_range(src_fd, dst_fd, offset, count):
+        return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+else:
+    copy_file_range = None
+
+if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):  # Elsewhere sendfile only writes to sockets
+    def sendfile(src_fd, dst_fd, offset, count):
+        return os.sendfile(dst_fd, src_fd, offset, count)
+else:
+    sendfile = None
@@ -0,0 +1,112 @@
+import errno
+import os
+import shutil
+
+from .copying import PARTIAL_COPY_SUFFIX, UNSUPPORTED_ERRNOS
+from .hashing import new_hash
+from .repository import read_chunks
+
+
+def chunk_hash(chunk):
+    digest = new_hash()
+    digest.update(chunk)
+    return digest.digest()
+
+
+def write_all(f, data):
+    view = memoryview(data)
+    while view:
+        view = view[f.write(view):]
+
+
+class DeltaCopier:
+    # rsync-style update of a large file that already has a copy (the base) in the
+    # destination. The base is split into content-defined chunks, the same rolling-window
+    # boundaries the repository uses, and only the source chunks missing from it are
+    # written. A base of the same size as the source that is also the destination is
+    # updated in place, leaving matching chunks untouched (disk images, database files).
+    # Otherwise the new file is written next to the destination, with matching chunks
+    # taken from the base by copy_file_range, which the filesystem can do without moving
+    # the data (reflinks, server-side copies on NFS and SMB).
+    def __init__(self):
+        self.copy_ranges = hasattr(os, 'copy_file_range')
+
+    def can_update(self, src_size, dst, base):
+        return (base == dst and os.path.getsize(base) == src_size) or self.copy_ranges
+
+    def copy(self, src, dst, base, on_copied, on_matched, digest=None):
+        # Returns the number of bytes written
+        by_offset = {}
+        by_hash = {}
+        offset = 0
+        with open(base, 'rb') as f:
+            for chunk in read_chunks(f):
+                block_hash = chunk_hash(chunk)
+                by_offset[offset] = block_hash
+                by_hash.setdefault(block_hash, offset)
+                offset += len(chunk)
+
+        if base == dst and offset == os.path.getsize(src):
+            written = self.update_in_place(src, dst, by_offset, on_copied, on_matched, digest)
+        else:
+            temp_path = dst + PARTIAL_COPY_SUFFIX  # Cleaned up like an unfinished copy
+            try:
+                written = self.write_from_base(src, temp_path, base, by_hash, on_copied, on_matched, digest)
+                os.replace(temp_path, dst)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        shutil.copystat(src, dst)
+        return written
+
+    def update_in_place(self, src, dst, by_offset, on_copied, on_matched, digest):
+        written = 0
+        offset = 0
+        with open(src, 'rb') as fsrc, open(dst, 'r+b', buffering=0) as fdst:
+            for chunk in read_chunks(fsrc):
+                if digest is not None:
+                    digest.update(chunk)
+                if by_offset.get(offset) == chunk_hash(chunk):
+                    on_matched(len(chunk))
+                else:
+                    fdst.seek(offset)
+                    write_all(fdst, chunk)
+                    written += len(chunk)
+                    on_copied(len(chunk))
+                offset += len(chunk)
+        return written
+
+    def write_from_base(self, src, dst, base, by_hash, on_copied, on_matched, digest):
+        written = 0
+        with open(src, 'rb') as fsrc, open(base, 'rb') as fbase, open(dst, 'wb', buffering=0) as fdst:
+            for chunk in read_chunks(fsrc):
+                if digest is not None:
+                    digest.update(chunk)
+                base_offset = by_hash.get(chunk_hash(chunk))
+                if base_offset is not None and self.copy_range(fbase, fdst, base_offset, len(chunk)):
+                    on_matched(len(chunk))
+                else:
+                    write_all(fdst, chunk)
+                    written += len(chunk)
+                    on_copied(len(chunk))
+        return written
+
+    def copy_range(self, fbase, fdst, base_offset, length):
+        if not self.copy_ranges:
+            return False
+        position = fdst.tell()
+        copied = 0
+        while copied < length:
+            try:
+                count = os.copy_file_range(fbase.fileno(), fdst.fileno(), length - copied,
+                                           base_offset + copied, position + copied)
+            except OSError as e:
+                if copied == 0 and e.errno in UNSUPPORTED_ERRNOS:
+                    self.copy_ranges = False  # Not between these files; write the chunks instead
+                    return False
+                raise
+            if not count:
+                raise OSError(errno.EIO, f"Base copy ended early at {base_offset + copied}")
+            copied += count
+        fdst.seek(position + length)
+        return True
@@ -0,0 +1,833 @@
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .archive import ArchiveStore, DEFAULT_COMPRESSION_LEVEL
+from .copying import DEFAULT_BUFFER_SIZE_MB, FileCopier, remove_partial
+from .delta import DeltaCopier
+from .hashing import hash_file, new_hash
+from .index import FileIndex
+from .journal import JOURNAL_FILE_NAME, ChangeJournal
+from .packs import PACKS_FOLDER_NAME, PackStore
+from .planning import (
+    ACTION_COPY, ACTION_CREATE, ACTION_DELETE, ACTION_LINK, ACTION_PACK, ACTION_SKIP, ACTION_STORE, ACTION_UPDATE,
+    add_to_totals, new_plan, plan_summary, planned_items, stat_fields
+)
+from .progress import ProgressReporter, format_size
+from .repository import ChunkRepository
+from .resume import RunJournal
+from .retention import SnapshotPruner, parse_retention
+from .snapshots import SNAPSHOT_NAME_FORMAT, SnapshotStore
+from .throttle import Throttle, lower_priority, parse_throttle
+
+
+DEFAULT_WORKERS = 4  # Concurrent copy threads
+QUEUE_SIZE_PER_WORKER = 4  # Files queued per worker before the walk blocks
+
+MODE_MIRROR = 'mirror'  # Plain copy of every file under the destination folder
+MODE_REPOSITORY = 'repository'  # Deduplicated chunk store under the destination folder
+MODE_ARCHIVE = 'archive'  # Compressed archive of the changed files per run under the destination folder
+MODE_SNAPSHOT = 'snapshot'  # Dated copy per run, unchanged files hard-linked to the previous one
+MODES = {MODE_MIRROR: "Mirror", MODE_SNAPSHOT: "Snapshots", MODE_REPOSITORY: "Repository",
+         MODE_ARCHIVE: "Compressed Archive"}
+
+COMPARE_METADATA = 'metadata'  # Unchanged when size and modification time match
+COMPARE_CONTENT = 'content'  # Unchanged when the content hash matches, hashing only files whose metadata changed
+COMPARE_MODES = {COMPARE_METADATA: "Size and date", COMPARE_CONTENT: "Content hash"}
+
+# What happens in mirror mode to copies of files and folders that were deleted from the source
+DELETIONS_KEEP = 'keep'
+DELETIONS_DELETE = 'delete'
+DELETIONS_QUARANTINE = 'quarantine'  # Moved below QUARANTINE_FOLDER_NAME, in a folder per run
+DELETIONS = {DELETIONS_KEEP: "Keep", DELETIONS_DELETE: "Delete", DELETIONS_QUARANTINE: "Move to quarantine"}
+QUARANTINE_FOLDER_NAME = '.quarantine'
+
+
+class CopyPool:
+    def __init__(self, workers, initializer=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers, initializer=initializer)
+        self.queue_size = workers * QUEUE_SIZE_PER_WORKER
+        self.slots = threading.BoundedSemaphore(self.queue_size)
+
+    def submit(self, fn, *args):
+        self.slots.acquire()  # Blocks the producer while the work queue is full
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self.slots.release())
+
+    def drain(self):
+        # Holding every slot at once means no submitted task is still running
+        for _ in range(self.queue_size):
+            self.slots.acquire()
+        for _ in range(self.queue_size):
+            self.slots.release()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def scan_tree(root, unlisted=None):
+    # Yields (relative path, stat) for every folder and file under root, each folder
+    # before its contents, reusing the stat data cached on os.scandir entries. The relative
+    # paths of folders and files that could not be read, other than those deleted meanwhile,
+    # are added to unlisted ('' for root itself).
+    pending = ['']
+    while pending:
+        relative_dir = pending.pop()
+        try:
+            with os.scandir(os.path.join(root, relative_dir)) as entries:
+                for entry in entries:
+                    relative_path = os.path.join(relative_dir, entry.name) if relative_dir else entry.name
+                    try:
+                        is_folder = entry.is_dir(follow_symlinks=False)
+                        if is_folder:
+                            entry_stat = entry.stat(follow_symlinks=False)
+                        elif entry.is_file():
+                            entry_stat = entry.stat()
+                        else:
+                            continue
+                    except OSError as e:
+                        # Only this entry, e.g. a temporary file deleted since the folder was listed
+                        logging.warning(f"Skipped {os.path.join(root, relative_path)} ({e})")
+                        if unlisted is not None and not isinstance(e, FileNotFoundError):
+                            unlisted.add(relative_path)
+                        continue
+                    yield relative_path, entry_stat
+                    if is_folder:
+                        pending.append(relative_path)
+        except OSError as e:
+            logging.warning(f"Skipped folder: {os.path.join(root, relative_dir)} ({e})")
+            if unlisted is not None and not isinstance(e, FileNotFoundError):
+                unlisted.add(relative_dir)
+
+
+def is_below(relative_path, folders):
+    # Whether relative_path is one of folders or inside one of them, '' standing for the whole tree
+    while True:
+        if relative_path in folders:
+            return True
+        if not relative_path:
+            return False
+        relative_path = os.path.dirname(relative_path)
+
+
+class BackupEngine(ProgressReporter):
+    # Qt-free backup run, reporting progress through the ProgressReporter callbacks
+    def __init__(self, items, destination_folder, workers=DEFAULT_WORKERS, mode=MODE_MIRROR, log_skipped=True,
+                 buffer_size_mb=DEFAULT_BUFFER_SIZE_MB, compare=COMPARE_METADATA, verify=False,
+                 compression_level=DEFAULT_COMPRESSION_LEVEL, pack_threshold_kb=0, delta_threshold_mb=0, retention='',
+                 deletions=DELETIONS_KEEP, change_journal=False, throttle='', low_priority=False, plan=None,
+                 journal_file=JOURNAL_FILE_NAME, on_progress=None, on_throughput=None, on_status=None):
+        super().__init__(on_progress, on_throughput, on_status)
+        self.items = items
+        self.destination_folder = destination_folder
+        self.total_items = len(items)  # Total items to backup
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.log_skipped = log_skipped  # When off, unchanged files only show up in the summary counts
+        self.copier = FileCopier(buffer_size_mb)
+        self.compare = compare
+        self.verify = verify
+        self.compression_level = compression_level
+        self.pack_threshold = pack_threshold_kb * 1024  # Mirror files smaller than this go into pack files
+        self.delta_threshold = delta_threshold_mb * 1024 * 1024  # Large changed files only get their changes written
+        self.delta_copier = DeltaCopier()
+        self.retention = parse_retention(retention)  # Snapshots to keep after each run, keeps all when empty
+        self.deletions = deletions if mode == MODE_MIRROR else DELETIONS_KEEP
+        self.change_journal = change_journal  # Back up only the paths a JournalWatcher saw change, when it can tell
+        self.journal_file = journal_file
+        self.throttle = Throttle(parse_throttle(throttle))  # Limits on copied bytes and file operations per second
+        self.low_priority = low_priority  # Run at a lower CPU and disk priority than other programs
+        self.deleted_paths = {}  # Paths the change journal saw deleted, per folder listed from the journal
+        self.unlisted_paths = {}  # Source paths that could not be read, per folder; their copies are never deleted
+        self.plan = plan  # A plan from make_plan, whose source listing is used instead of walking the items again
+        self.run_journal = None  # Progress of the run, kept so an interrupted one can be resumed
+
+    def run(self):
+        if self.plan is not None and (self.plan['destination_folder'], self.plan['mode']) != (
+                self.destination_folder, self.mode):
+            raise ValueError("The plan was made for another destination or destination mode")
+        initializer = lower_priority if self.low_priority else None
+        if initializer is not None:
+            initializer()  # The walk runs on this thread
+        self.pool = CopyPool(self.workers, initializer)
+        copies = self.mode in (MODE_MIRROR, MODE_SNAPSHOT)
+        # Copies are re-read from the destination in their own pool, overlapping with the copies still running
+        self.verify_pool = CopyPool(self.workers, initializer) if self.verify and copies else None
+        self.run_journal = RunJournal(self.destination_folder, self.journal_target()) if copies else None
+        self.open_destination()
+        if self.snapshot is not None:
+            self.snapshot.start()
+        checkpoint = self.open_journal()
+        self.resume_run()
+        finished = False
+
+        try:
+            if self.plan is not None:
+                scanned_items = [scanned for scanned in planned_items(self.plan) if not self.is_item_done(scanned[0])]
+                for planned in self.plan['items']:
+                    if planned.get('unlisted'):
+                        self.complete = False
+                        self.unlisted_paths[planned['path']] = set(planned['unlisted'])
+            elif checkpoint is not None and checkpoint['synced']:
+                scanned_items = self.scan_items(checkpoint)
+            else:
+                scanned_items = self.scan_items()
+            total_files, total_bytes = self.count_files(scanned_items)
+            self.start_progress(total_files, total_bytes,
+                                f"Found {total_files} files ({format_size(total_bytes)}) to back up")
+            for item, item_stat, entries in scanned_items:
+                failed = self.outcomes['failed']
+                if entries is None:
+                    self.backup_file(item, item_stat)
+                    backed_up = True
+                else:
+                    backed_up = self.backup_folder(item, entries)
+                if (self.run_journal is not None and backed_up and self.outcomes['failed'] == failed
+                        and item not in self.unlisted_paths):
+                    self.run_journal.finish_item(item)
+                    self.save_run_journal()
+            if self.verify_pool is not None:
+                self.report_status("Verifying copies...", force=True)
+                self.verify_pool.drain()
+            self.report_status("Backup completed", force=True)
+            logging.info(f"Backup completed: {self.summary()}")
+            if checkpoint is not None:
+                self.commit_journal(checkpoint)
+            finished = True
+        finally:
+            self.pool.shutdown()
+            if self.verify_pool is not None:
+                self.verify_pool.shutdown()
+            if copies:
+                if self.packs is not None:
+                    self.packs.save()  # Before the index, which must not list files missing from the packs
+                if self.snapshot is not None and finished:
+                    self.snapshot.finish()  # Before the index, which describes the latest finished snapshot
+                # An interrupted snapshot stays partial, for the next run to resume, and is never pruned
+                self.index.save()
+            else:
+                self.store.save()
+            if self.run_journal is not None:
+                # Kept for the next run to resume, unless this one got to the end
+                if finished:
+                    self.run_journal.remove()
+                else:
+                    self.run_journal.save()
+
+        if self.snapshot is not None:
+            # Also deletes the snapshots older runs left unfinished, without a retention policy too
+            pruned = SnapshotPruner(self.destination_folder, self.retention, self.workers, self.on_status).run()
+            if self.retention:
+                self.on_status(f"Backup completed, pruned {len(pruned)} snapshots | {self.summary()}")
+        return self.outcomes
+
+    def make_plan(self):
+        # Dry run: walks the items and compares them with the destination the way run() would,
+        # without writing anything. Passed back in as plan=, the run skips the walk.
+        self.open_destination(read_only=True)
+        plan = new_plan(self.destination_folder, self.mode)
+        try:
+            scanned_items = self.scan_items()
+            total_files, total_bytes = self.count_files(scanned_items)
+            self.start_progress(total_files, total_bytes,
+                                f"Found {total_files} files ({format_size(total_bytes)}) to plan")
+            for item, item_stat, entries in scanned_items:
+                if entries is None:
+                    action = self.plan_file(item, os.path.basename(item), item_stat)
+                    add_to_totals(plan, action, item_stat.st_size)
+                    plan['items'].append({'path': item, 'stat': stat_fields(item_stat), 'action': action,
+                                          'entries': None})
+                else:
+                    plan['items'].append(self.plan_folder(plan, item, item_stat, entries))
+            self.report_status(f"Plan: {plan_summary(plan)}", force=True)
+        finally:
+            if isinstance(self.store, ArchiveStore):
+                self.store.close()
+        return plan
+
+    def resume_run(self):
+        # Carries on where an interrupted run of the same backup stopped: its finished items and
+        # files are skipped, and the copies it left unfinished are removed
+        if self.run_journal is None:
+            return
+        if self.snapshot is not None:
+            if self.run_journal.resumed and self.run_journal.snapshot != self.snapshot.name:
+                self.run_journal.discard()  # Its snapshot is gone, so nothing it did is left
+            self.run_journal.snapshot = self.snapshot.name
+        if not self.run_journal.resumed:
+            return
+        for key in self.run_journal.interrupted_copies:
+            remove_partial(os.path.join(self.target_folder, key))
+        if self.run_journal.items:
+            self.complete = False  # The change journal keeps what changed in the skipped items
+        message = (f"Resuming the backup started {self.run_journal.started}: {len(self.run_journal.items)} items "
+                   f"and {len(self.run_journal.files)} files were already backed up")
+        self.on_status(message)
+        logging.info(message)
+
+    def is_item_done(self, item):
+        return self.run_journal is not None and self.run_journal.is_item_done(item)
+
+    def is_file_done(self, index_key, file_stat):
+        return self.run_journal is not None and self.run_journal.is_done(index_key, file_stat)
+
+    def save_run_journal(self):
+        # Saves the packs and the index first, so the run journal lists no file they do not
+        if not self.run_journal.save_due():
+            return
+        if self.packs is not None:
+            self.packs.checkpoint()
+        self.index.save()
+        self.run_journal.save()
+
+    def open_destination(self, read_only=False):
+        # Files are written below target_folder and compared with their copies below reference_folder.
+        # Nothing is written to the destination until something is backed up; read_only (for plans)
+        # keeps the file index from being written at all.
+        self.target_folder = self.reference_folder = self.destination_folder
+        self.store = None
+        self.snapshot = None
+        self.packs = None
+        if self.mode == MODE_REPOSITORY:
+            self.store = ChunkRepository(self.destination_folder)
+            self.process_file = self.store_file
+        elif self.mode == MODE_ARCHIVE:
+            self.store = ArchiveStore(self.destination_folder, self.compression_level, self.workers)
+            self.process_file = self.store_file
+        elif self.mode == MODE_SNAPSHOT:
+            self.snapshot = SnapshotStore(self.destination_folder, self.run_journal and self.run_journal.snapshot)
+            self.index = FileIndex(self.snapshot.path, read_only)  # Describes the latest snapshot
+            self.target_folder = self.snapshot.partial_path
+            self.reference_folder = self.snapshot.previous_path or self.snapshot.partial_path
+            self.process_file = self.copy_file
+        else:
+            self.index = FileIndex(self.destination_folder, read_only)
+            self.process_file = self.copy_file
+            # Opened whenever packs exist, so files that outgrow the threshold drop their packed copy
+            packs_exist = os.path.isdir(os.path.join(self.destination_folder, PACKS_FOLDER_NAME))
+            self.packs = PackStore(self.destination_folder) if self.pack_threshold or packs_exist else None
+            if self.deletions == DELETIONS_QUARANTINE:
+                quarantine_path = os.path.join(self.destination_folder, QUARANTINE_FOLDER_NAME)
+                stem = os.path.join(quarantine_path, time.strftime(SNAPSHOT_NAME_FORMAT))
+                self.quarantine_folder = stem
+                number = 1
+                while os.path.exists(self.quarantine_folder):
+                    number += 1
+                    self.quarantine_folder = f"{stem}-{number}"
+
+    def open_journal(self):
+        # The change journal checkpoint this run starts from, or None when no watcher is recording.
+        # Snapshots need every file linked or copied, so they always walk the items.
+        self.journal = None
+        self.complete = True  # Cleared when something is skipped that the journal would then forget
+        if not self.change_journal or self.mode == MODE_SNAPSHOT or self.plan is not None:
+            return None
+        journal = ChangeJournal(self.journal_file)
+        try:
+            checkpoint = journal.checkpoint(self.journal_target())
+        except sqlite3.Error as e:
+            logging.warning(f"Change journal unavailable at {self.journal_file} ({e})")
+            return None
+        if checkpoint is None:
+            logging.info("No watcher is recording changes, walking all items")
+        elif not checkpoint['synced']:
+            logging.info("The change journal does not cover this destination yet, walking all items")
+        self.journal = journal
+        return checkpoint
+
+    def journal_target(self):
+        # What a journal checkpoint is valid for: backups of the same items to the same place
+        return json.dumps([self.destination_folder, self.mode, sorted(self.items)])
+
+    def commit_journal(self, checkpoint):
+        # Changes are only dropped from the journal once every one of them was backed up
+        if not self.complete or self.outcomes['failed'] or self.outcomes['mismatched']:
+            logging.info("Kept the changes in the change journal for the next run")
+            return
+        try:
+            if not self.journal.commit(checkpoint, self.journal_target()):
+                logging.info("The watcher stopped during the backup, the next run walks all items")
+        except sqlite3.Error as e:
+            logging.warning(f"Change journal unavailable at {self.journal_file} ({e})")
+
+    def scan_items(self, checkpoint=None):
+        # Pre-scan every item once so progress can be reported in bytes; the
+        # entries found here are what the backup then works through. With a change
+        # journal checkpoint, the watched folders only list what changed since the last run.
+        changed = {}
+        if checkpoint is not None:
+            changed = {folder: [] for folder in checkpoint['folders']}
+            for path in self.journal.changes(checkpoint):
+                for folder in changed:
+                    if path.startswith(folder + os.sep):
+                        changed[folder].append(path[len(folder) + 1:])
+                        break
+            self.on_status(f"Checking {sum(len(paths) for paths in changed.values())} changed paths...")
+        else:
+            self.on_status(f"Scanning {self.total_items} items...")
+        scanned_items = []
+        for item in self.items:
+            if self.is_item_done(item):
+                continue
+            try:
+                item_stat = os.stat(item)
+                if not stat.S_ISDIR(item_stat.st_mode):
+                    scanned_items.append((item, item_stat, None))
+                elif item in changed and (self.mode != MODE_MIRROR
+                                          or os.path.isdir(os.path.join(self.target_folder, os.path.basename(item)))):
+                    entries, self.deleted_paths[item] = self.changed_entries(item, changed[item])
+                    scanned_items.append((item, item_stat, entries))
+                else:
+                    unlisted = set()
+                    scanned_items.append((item, item_stat, list(scan_tree(item, unlisted))))
+                    if unlisted:
+                        self.complete = False
+                        self.unlisted_paths[item] = unlisted
+            except OSError as e:
+                self.complete = False
+                self.outcomes['failed'] += 1  # Before the progress starts, so not through report_status
+                self.on_status(f"Skipped {item} ({e})")
+                logging.warning(f"Skipped {item} ({e})")
+        return scanned_items
+
+    def changed_entries(self, folder_path, relative_paths):
+        # The entries scan_tree would list for the changed paths below folder_path: the folders
+        # leading to them and everything inside changed folders. Also returns the deleted paths.
+        entries = []
+        listed = set()
+        deleted = []
+        for relative_path in sorted(set(relative_paths)):
+            if relative_path in listed:
+                continue
+            path = os.path.join(folder_path, relative_path)
+            try:
+                entry_stat = os.lstat(path)
+                if stat.S_ISLNK(entry_stat.st_mode):
+                    entry_stat = os.stat(path)  # Like scan_tree, follow links to files but not to folders
+                    if not stat.S_ISREG(entry_stat.st_mode):
+                        continue
+                parents = []
+                parent = os.path.dirname(relative_path)
+                while parent and parent not in listed:
+                    parents.append((parent, os.stat(os.path.join(folder_path, parent))))
+                    parent = os.path.dirname(parent)
+            except (FileNotFoundError, NotADirectoryError):
+                deleted.append(relative_path)
+                continue
+            except OSError as e:
+                self.complete = False  # Kept in the change journal for the next run
+                logging.warning(f"Skipped {path} ({e})")
+                continue
+            for parent, parent_stat in reversed(parents):
+                entries.append((parent, parent_stat))
+                listed.add(parent)
+            entries.append((relative_path, entry_stat))
+            listed.add(relative_path)
+            if stat.S_ISDIR(entry_stat.st_mode):
+                unlisted = set()
+                for sub_path, sub_stat in scan_tree(path, unlisted):
+                    entries.append((os.path.join(relative_path, sub_path), sub_stat))
+                    listed.add(os.path.join(relative_path, sub_path))
+                if unlisted:
+                    self.complete = False
+        return entries, deleted
+
+    def count_files(self, scanned_items):
+        total_files = 0
+        total_bytes = 0
+        for item, item_stat, entries in scanned_items:
+            if entries is None:
+                file_stats = [item_stat]
+            else:
+                folder_name = os.path.basename(item)
+                file_stats = [entry_stat for relative_path, entry_stat in entries
+                              if not self.is_file_done(os.path.join(folder_name, relative_path), entry_stat)]
+            for file_stat in file_stats:
+                if not stat.S_ISDIR(file_stat.st_mode):
+                    total_files += 1
+                    total_bytes += file_stat.st_size
+        return total_files, total_bytes
+
+    def summary(self):
+        summary = super().summary()
+        if self.verify:
+            summary += f", {self.outcomes['mismatched']} failed verification"
+        if self.deletions != DELETIONS_KEEP:
+            summary += f", {self.outcomes['deleted']} removed"
+        return summary
+
+    def set_throttle(self, throttle):
+        # Takes effect for the running copies within a fraction of a second
+        self.throttle.set_rules(parse_throttle(throttle))
+        logging.info(f"Speed limit changed to {throttle or 'unlimited'}")
+
+    def backup_file(self, file_path, file_stat):
+        file_name = os.path.basename(file_path)
+        destination_file_path = os.path.join(self.target_folder, file_name)
+        self.pool.submit(self.process_file, file_path, destination_file_path, file_name, file_stat)
+        self.pool.drain()
+
+    def copy_file(self, file_path, destination_file_path, index_key, file_stat):
+        processed = 0
+
+        def on_copied(length):
+            nonlocal processed
+            processed += length
+            self.advance_progress(length, length)
+            self.throttle.take_bytes(length)
+
+        def on_matched(length):
+            nonlocal processed
+            processed += length
+            self.advance_progress(length, 0)
+
+        try:
+            action, content_hash = self.choose_action(file_path, file_stat, destination_file_path, index_key)
+            if action == ACTION_LINK and not self.snapshot.link(index_key, destination_file_path):
+                action = ACTION_COPY
+            if action != ACTION_SKIP:
+                self.throttle.take_operation()
+            if action == ACTION_PACK:
+                processed = self.packs.add(index_key, file_path, file_stat)
+                self.advance_progress(processed, processed)
+                self.throttle.take_bytes(processed)
+                self.index.record(index_key, file_stat, content_hash)
+                self.report_status(f"Packed {file_path}", 'copied')
+                logging.info(f"Packed {file_path} into {self.packs.path}")
+            elif action in (ACTION_COPY, ACTION_UPDATE):
+                # Hash the source while copying it, unless comparing by content already did
+                digest = new_hash() if self.verify_pool is not None and content_hash is None else None
+                if self.run_journal is not None:
+                    self.run_journal.start_copy(index_key)
+                if action == ACTION_UPDATE:
+                    written = self.delta_copier.copy(file_path, destination_file_path,
+                                                     os.path.join(self.reference_folder, index_key),
+                                                     on_copied, on_matched, digest)
+                    message = (f"Updated {destination_file_path} from {file_path} "
+                               f"({written * 100 // max(1, file_stat.st_size)}% rewritten)")
+                else:
+                    self.copier.copy(file_path, destination_file_path, on_copied, digest)
+                    message = f"Copied {file_path} to {destination_file_path}"
+                if digest is not None:
+                    content_hash = digest.hexdigest()
+                self.index.record(index_key, file_stat, content_hash)
+                if self.packs is not None:
+                    self.packs.forget(index_key)
+                self.report_status(message, 'copied')
+                logging.info(message)
+                if self.verify_pool is not None:
+                    self.verify_pool.submit(self.verify_copy, destination_file_path, index_key, content_hash)
+            else:
+                self.report_status(f"Skipped {file_path} (No changes)", 'skipped')
+                if self.log_skipped:
+                    logging.info(f"Skipped {file_path} (No changes)")
+            self.end_file(index_key, file_stat)
+        except Exception as e:
+            self.report_status(f"Skipped {file_path} ({e})", 'failed')
+            logging.warning(f"Skipped {file_path} ({e})")
+            self.end_file(index_key)
+        finally:
+            self.advance_progress(max(file_stat.st_size - processed, 0), 0, 1)
+
+    def end_file(self, index_key, file_stat=None):
+        # Tells the run journal that the file is backed up, when given its stat, or failed
+        if self.run_journal is not None:
+            self.run_journal.end_file(index_key, file_stat)
+            self.save_run_journal()
+
+    def choose_action(self, file_path, file_stat, destination_file_path, index_key):
+        # Returns what copy_file should do, and the source's content hash if comparing computed it
+        packed = self.packs is not None and file_stat.st_size < self.pack_threshold
+        reference_file_path = os.path.join(self.reference_folder, index_key)
+        same, content_hash = self.compare_file(file_path, file_stat, reference_file_path, index_key)
+        if same and self.snapshot is not None:
+            # A touched file that matched by content keeps the previous copy and its date
+            same = self.snapshot.can_link(index_key, file_stat, check_mtime=self.compare != COMPARE_CONTENT)
+        if same and packed and not self.packs.contains(index_key):
+            same = False  # Backed up as a separate file before packing was turned on
+        if same:
+            action = ACTION_LINK if self.snapshot is not None else ACTION_SKIP
+        elif packed:
+            action = ACTION_PACK
+        elif self.use_delta(file_stat, destination_file_path, reference_file_path):
+            action = ACTION_UPDATE
+        else:
+            action = ACTION_COPY
+        return action, content_hash
+
+    def plan_file(self, file_path, index_key, file_stat):
+        try:
+            if self.store is not None:
+                return ACTION_SKIP if self.store.is_unchanged(index_key, file_stat) else ACTION_STORE
+            destination_file_path = os.path.join(self.target_folder, index_key)
+            return self.choose_action(file_path, file_stat, destination_file_path, index_key)[0]
+        except OSError as e:
+            self.report_status(f"Could not compare {file_path} ({e})")
+            return ACTION_COPY
+        finally:
+            self.advance_progress(file_stat.st_size, 0, 1)
+
+    def plan_folder(self, plan, folder_path, folder_stat, entries):
+        folder_name = os.path.basename(folder_path)
+        destination_path = os.path.join(self.target_folder, folder_name)
+        mirror = self.mode in (MODE_MIRROR, MODE_SNAPSHOT)
+        destination_exists = mirror and os.path.isdir(destination_path)
+        if mirror and not destination_exists:
+            add_to_totals(plan, ACTION_CREATE)
+        planned_entries = []
+        for relative_path, entry_stat in entries:
+            if not stat.S_ISDIR(entry_stat.st_mode):
+                action = self.plan_file(os.path.join(folder_path, relative_path),
+                                        os.path.join(folder_name, relative_path), entry_stat)
+                add_to_totals(plan, action, entry_stat.st_size)
+            elif mirror and not (destination_exists and os.path.isdir(os.path.join(destination_path, relative_path))):
+                action = ACTION_CREATE
+                add_to_totals(plan, action)
+            else:
+                action = ACTION_SKIP
+            planned_entries.append([relative_path, action] + stat_fields(entry_stat))
+
+        deletions = []
+        if self.deletions != DELETIONS_KEEP and destination_exists:
+            stale, stale_packed = self.find_stale(folder_name, destination_path, entries,
+                                                  self.unlisted_paths.get(folder_path, ()))
+            deletions = [relative_path for relative_path in stale if os.path.dirname(relative_path) not in stale]
+            deletions += [key[len(folder_name) + 1:] for key in stale_packed]
+            for _ in deletions:
+                add_to_totals(plan, ACTION_DELETE)
+        return {'path': folder_path, 'stat': stat_fields(folder_stat), 'entries': planned_entries,
+                'deletions': deletions, 'unlisted': sorted(self.unlisted_paths.get(folder_path, ()))}
+
+    def use_delta(self, file_stat, destination_file_path, reference_file_path):
+        # Reading the previous copy to find what changed only pays off for large files
+        return (self.delta_threshold and file_stat.st_size >= self.delta_threshold
+                and os.path.isfile(reference_file_path)
+                and self.delta_copier.can_update(file_stat.st_size, destination_file_path, reference_file_path))
+
+    def verify_copy(self, destination_file_path, index_key, expected_hash):
+        try:
+            if hash_file(destination_file_path, drop_cache=True) == expected_hash:
+                return
+            message = f"Verification failed for {destination_file_path} (Content differs from source)"
+        except Exception as e:
+            message = f"Verification failed for {destination_file_path} ({e})"
+        self.index.invalidate(index_key)  # Copy it again on the next run
+        self.report_status(message, 'mismatched')
+        logging.warning(message)
+
+    def store_file(self, file_path, destination_file_path, index_key, file_stat):
+        stored = 0
+
+        def on_stored(length):
+            nonlocal stored
+            stored += length
+            self.advance_progress(length, length)
+            self.throttle.take_bytes(length)
+
+        try:
+            if not self.store.is_unchanged(index_key, file_stat):
+                self.throttle.take_operation()
+                details = self.store.store_file(index_key, file_path, file_stat, on_stored)
+                self.report_status(f"Stored {file_path} ({details})", 'copied')
+                logging.info(f"Stored {file_path} in {self.store.path} ({details})")
+            else:
+                self.report_status(f"Skipped {file_path} (No changes)", 'skipped')
+                if self.log_skipped:
+                    logging.info(f"Skipped {file_path} (No changes)")
+        except Exception as e:
+            self.report_status(f"Skipped {file_path} ({e})", 'failed')
+            logging.warning(f"Skipped {file_path} ({e})")
+        finally:
+            self.advance_progress(max(file_stat.st_size - stored, 0), 0, 1)
+
+    def compare_file(self, src, src_stat, dst, index_key):
+        # Returns whether the destination is up to date, and the source's content hash if it was computed
+        if self.index.is_unchanged(index_key, src_stat):
+            return True, None
+        if self.compare == COMPARE_CONTENT:
+            return self.compare_content(src, src_stat, dst, index_key)
+        if self.index.is_indexed(index_key):
+            return False, None
+
+        # Not indexed yet (e.g. first run with the index): fall back to comparing against the destination
+        try:
+            dst_stat = os.stat(dst)
+        except FileNotFoundError:
+            return False, None
+        if src_stat.st_mtime == dst_stat.st_mtime and src_stat.st_size == dst_stat.st_size:
+            self.index.record(index_key, src_stat)
+            return True, None
+        return False, None
+
+    def compare_content(self, src, src_stat, dst, index_key):
+        # The metadata changed (e.g. after a touch), so hash the source and compare it with the
+        # hash recorded for the destination copy, hashing the destination only if none was recorded
+        source_hash = hash_file(src)
+        destination_hash = self.index.content_hash(index_key)
+        if destination_hash is None:
+            if not os.path.exists(dst):
+                return False, source_hash
+            destination_hash = hash_file(dst)
+        if source_hash == destination_hash:
+            self.index.record(index_key, src_stat, source_hash)
+            return True, source_hash
+        return False, source_hash
+
+    def find_stale(self, folder_name, destination_path, entries, unlisted=()):
+        # One pass over the destination copy, and dict lookups against the source entries to find
+        # what no longer exists there or turned from a file into a folder or back: {relative path:
+        # is folder} and the keys of packed files. Copies in or below unlisted source paths are kept,
+        # as their source could not be read.
+        source_folders = {relative_path: stat.S_ISDIR(entry_stat.st_mode) for relative_path, entry_stat in entries}
+        stale = {}
+        for relative_path, entry_stat in scan_tree(destination_path):
+            is_folder = stat.S_ISDIR(entry_stat.st_mode)
+            if source_folders.get(relative_path) != is_folder and not is_below(relative_path, unlisted):
+                stale[relative_path] = is_folder
+        stale_packed = []
+        if self.packs is not None:
+            prefix = folder_name + os.sep
+            stale_packed = [key for key in self.packs.entries if key.startswith(prefix) and self.packs.contains(key)
+                            and source_folders.get(key[len(prefix):]) is not False
+                            and not is_below(key[len(prefix):], unlisted)]
+        return stale, stale_packed
+
+    def find_deleted(self, folder_name, destination_path, deleted, entries=()):
+        # Like find_stale, for the paths the change journal saw deleted and the changed entries whose
+        # copy is of the other type, looking only at their copies
+        source_folders = {relative_path: stat.S_ISDIR(entry_stat.st_mode) for relative_path, entry_stat in entries}
+        replaced = []
+        for relative_path, is_folder in source_folders.items():
+            path = os.path.join(destination_path, relative_path)
+            if os.path.lexists(path) and (os.path.isdir(path) and not os.path.islink(path)) != is_folder:
+                replaced.append(relative_path)
+        stale = {}
+        for relative_path in list(deleted) + replaced:
+            path = os.path.join(destination_path, relative_path)
+            if os.path.isdir(path) and not os.path.islink(path):
+                stale[relative_path] = True
+                for sub_path, entry_stat in scan_tree(path):
+                    stale[os.path.join(relative_path, sub_path)] = stat.S_ISDIR(entry_stat.st_mode)
+            elif os.path.lexists(path):
+                stale[relative_path] = False
+        stale_packed = []
+        if self.packs is not None:
+            deleted_keys = {os.path.join(folder_name, relative_path) for relative_path in deleted}
+            prefix = folder_name + os.sep
+            for key in self.packs.entries:
+                if not key.startswith(prefix) or not self.packs.contains(key):
+                    continue
+                if source_folders.get(key[len(prefix):]):
+                    stale_packed.append(key)  # Now a folder
+                    continue
+                parent = key
+                while parent != folder_name and parent not in deleted_keys:
+                    parent = os.path.dirname(parent)
+                if parent != folder_name:
+                    stale_packed.append(key)
+        return stale, stale_packed
+
+    def remove_stale(self, folder_name, destination_path, stale, stale_packed):
+        # Only the top of each stale subtree is removed or moved
+        for relative_path, is_folder in stale.items():
+            if not is_folder:
+                self.index.remove(os.path.join(folder_name, relative_path))
+            if os.path.dirname(relative_path) not in stale:
+                self.pool.submit(self.remove_stale_entry, destination_path, folder_name, relative_path, is_folder)
+        # Finish before copying, so a file renamed only in case is not removed after its new copy was written
+        self.pool.drain()
+        for key in stale_packed:
+            self.remove_stale_packed(key)
+
+    def remove_stale_packed(self, key):
+        try:
+            self.throttle.take_operation()
+            if self.deletions == DELETIONS_QUARANTINE:
+                quarantine_path = os.path.join(self.quarantine_folder, key)
+                os.makedirs(os.path.dirname(quarantine_path), exist_ok=True)
+                self.packs.extract(key, quarantine_path)
+                message = f"Moved {key} from the packs to {quarantine_path} (Deleted from source)"
+            else:
+                message = f"Deleted {key} from the packs (Deleted from source)"
+            self.packs.forget(key)
+            self.index.remove(key)
+            self.report_status(message, 'deleted')
+            logging.info(message)
+        except Exception as e:
+            self.report_status(f"Failed to remove {key} from the packs ({e})", 'failed')
+            logging.warning(f"Failed to remove {key} from the packs ({e})")
+
+    def remove_stale_entry(self, destination_path, folder_name, relative_path, is_folder):
+        path = os.path.join(destination_path, relative_path)
+        try:
+            self.throttle.take_operation()
+            if self.deletions == DELETIONS_QUARANTINE:
+                quarantine_path = os.path.join(self.quarantine_folder, folder_name, relative_path)
+                os.makedirs(os.path.dirname(quarantine_path), exist_ok=True)
+                os.replace(path, quarantine_path)
+                message = f"Moved {path} to {quarantine_path} (Deleted from source)"
+            else:
+                if is_folder:
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                message = f"Deleted {path} (Deleted from source)"
+            self.report_status(message, 'deleted')
+            logging.info(message)
+        except Exception as e:
+            self.report_status(f"Failed to remove {path} ({e})", 'failed')
+            logging.warning(f"Failed to remove {path} ({e})")
+
+    def create_folder(self, path):
+        # Fails for one folder only, e.g. where the source replaced a file with a folder and deletions
+        # are off; the files below it then fail on their own
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError as e:
+            self.complete = False
+            self.report_status(f"Failed to create folder {path} ({e})", 'failed')
+            logging.warning(f"Failed to create folder {path} ({e})")
+
+    def backup_folder(self, folder_path, entries):
+        folder_name = os.path.basename(folder_path)
+        destination_path = os.path.join(self.target_folder, folder_name)
+        try:
+            mirror = self.mode in (MODE_MIRROR, MODE_SNAPSHOT)
+            if mirror and not os.path.exists(destination_path):
+                os.makedirs(destination_path)
+                self.report_status(f"Created new folder: {destination_path}")
+                logging.info(f"Created new folder: {destination_path}")
+            elif self.deletions != DELETIONS_KEEP:
+                deleted = self.deleted_paths.get(folder_path)
+                if deleted is None:
+                    stale, stale_packed = self.find_stale(folder_name, destination_path, entries,
+                                                          self.unlisted_paths.get(folder_path, ()))
+                else:
+                    stale, stale_packed = self.find_deleted(folder_name, destination_path, deleted, entries)
+                self.remove_stale(folder_name, destination_path, stale, stale_packed)
+
+            for relative_path, entry_stat in entries:
+                destination_entry_path = os.path.join(destination_path, relative_path)
+                if stat.S_ISDIR(entry_stat.st_mode):
+                    if mirror:
+                        self.create_folder(destination_entry_path)
+                elif not self.is_file_done(os.path.join(folder_name, relative_path), entry_stat):
+                    self.pool.submit(self.process_file, os.path.join(folder_path, relative_path), destination_entry_path,
+                                     os.path.join(folder_name, relative_path), entry_stat)
+
+            self.pool.drain()
+            summary_message = f"Backup completed for folder: {folder_path}"
+            self.report_status(summary_message, force=True)
+            logging.info(summary_message)
+            return True
+        except Exception as e:
+            self.complete = False
+            self.report_status(f"Skipped folder: {folder_path} ({e})", 'failed', force=True)
+            logging.warning(f"Skipped folder: {folder_path} ({e})")
+            return False
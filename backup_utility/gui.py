@@ -0,0 +1,731 @@
+import logging
+import os
+import sys
+
+from PyQt5.QtCore import QThread, pyqtSignal, Qt
+from PyQt5.QtGui import QFont, QIcon
+from PyQt5.QtWidgets import (
+    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QListWidget,
+    QPushButton, QFileDialog, QMessageBox, QLabel, QGroupBox, QFormLayout,
+    QProgressBar, QSpinBox, QComboBox, QCheckBox, QLineEdit, QInputDialog
+)
+
+from .archive import DEFAULT_COMPRESSION_LEVEL
+from .config import DEFAULT_PROFILE, journal_file, load_profiles, save_profiles
+from .continuous import ContinuousBackup
+from .copying import DEFAULT_BUFFER_SIZE_MB
+from .engine import BackupEngine, COMPARE_MODES, DEFAULT_WORKERS, DELETIONS, MODES
+from .journal import JournalWatcher, journal_supported
+from .progress import format_duration
+from .logs import LOG_FILE_NAME, setup_logging, stop_logging
+from .planning import plan_summary, save_plan
+from .restore import RestoreEngine
+from .retention import parse_retention
+from .scheduler import parse_schedule
+from .throttle import parse_throttle
+
+
+class EngineWorker(QThread):
+    progress_updated = pyqtSignal(int)  # Signal to update progress (0-100)
+    throughput_updated = pyqtSignal(float, float)  # Signal to update MB/s and ETA in seconds (-1 if unknown)
+    status_updated = pyqtSignal(str)  # Signal to update status label
+    completed = pyqtSignal()
+
+    def __init__(self, task, engine_class, *args, action='run', **kwargs):
+        super().__init__()
+        self.task = task  # "Backup", "Preview" or "Restore", for error messages
+        self.engine = engine_class(*args, **kwargs,
+                                   on_progress=self.progress_updated.emit,
+                                   on_throughput=self.throughput_updated.emit,
+                                   on_status=self.status_updated.emit)
+        self.action = getattr(self.engine, action)
+        self.result = None
+        self.error = None  # Why the action failed, if it raised
+
+    def run(self):
+        try:
+            self.result = self.action()
+        except Exception as e:
+            self.error = e
+            self.status_updated.emit(f"{self.task} failed ({e})")
+            logging.error(f"{self.task} failed ({e})")
+        self.completed.emit()
+
+
+class BackupUtility(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.watcher = None  # Records changed paths while the change journal is on
+        self.watched = None  # Profile and items the watcher was started for
+        self.worker = None
+        self.initUI()
+        self.load_data()
+        self.log_listener = setup_logging()
+        self.update_watcher()
+        self.change_journal_check_box.toggled.connect(self.update_watcher)  # After loading, which sets it
+
+    def initUI(self):
+        # Main layout
+        main_layout = QVBoxLayout()
+
+        # Horizontal layout for list and buttons
+        h_layout = QHBoxLayout()
+
+        # File and Folder List Group
+        list_group = QGroupBox("Files and Folders to Backup")
+        list_layout = QVBoxLayout()
+        self.list_widget = QListWidget()
+        list_layout.addWidget(self.list_widget)
+        list_group.setLayout(list_layout)
+
+        # Adding list group to horizontal layout
+        h_layout.addWidget(list_group)
+
+        # Vertical layout for Actions and Info Groups
+        actions_info_layout = QVBoxLayout()
+
+        # Button Group
+        button_group = QGroupBox("Actions")
+        button_layout = QVBoxLayout()
+
+        add_file_button = QPushButton('Add File')
+        add_folder_button = QPushButton('Add Folder')
+        remove_button = QPushButton('Remove Selected')
+        set_destination_button = QPushButton('Set Destination')
+        preview_button = QPushButton('Preview Backup')
+        backup_button = QPushButton('Backup')
+        self.continuous_button = QPushButton('Start Continuous Backup')
+        if not journal_supported():
+            self.continuous_button.setToolTip("Needs Linux (inotify)")
+        new_profile_button = QPushButton('New Profile')
+        delete_profile_button = QPushButton('Delete Profile')
+
+        button_layout.addWidget(add_file_button)
+        button_layout.addWidget(add_folder_button)
+        button_layout.addWidget(remove_button)
+        button_layout.addWidget(set_destination_button)
+        button_layout.addWidget(preview_button)
+        button_layout.addWidget(backup_button)
+        button_layout.addWidget(self.continuous_button)
+        button_layout.addWidget(new_profile_button)
+        button_layout.addWidget(delete_profile_button)
+        button_layout.addStretch()
+        button_group.setLayout(button_layout)
+
+        # Setting fixed width for button group
+        button_group.setFixedWidth(300)
+
+        # Adding button group to actions_info_layout
+        actions_info_layout.addWidget(button_group)
+
+        # Settings Group
+        self.settings_group = QGroupBox("Settings")
+        settings_layout = QFormLayout()
+
+        self.profile_combo_box = QComboBox()
+        settings_layout.addRow("Profile:", self.profile_combo_box)
+
+        self.schedule_edit = QLineEdit()
+        self.schedule_edit.setPlaceholderText("Manual, or e.g. daily 02:00")
+        self.schedule_edit.setToolTip("When 'schedule' backs this profile up, e.g. 'every 6h', 'daily 02:00', "
+                                      "'weekdays 12:00,18:00' or 'sat,sun 09:30'")
+        settings_layout.addRow("Schedule:", self.schedule_edit)
+
+        self.workers_spin_box = QSpinBox()
+        self.workers_spin_box.setRange(1, 64)
+        self.workers_spin_box.setValue(DEFAULT_WORKERS)
+        settings_layout.addRow("Copy Workers:", self.workers_spin_box)
+
+        self.mode_combo_box = QComboBox()
+        for mode, label in MODES.items():
+            self.mode_combo_box.addItem(label, mode)
+        settings_layout.addRow("Destination Mode:", self.mode_combo_box)
+
+        self.compression_level_spin_box = QSpinBox()
+        self.compression_level_spin_box.setRange(1, 9)
+        self.compression_level_spin_box.setValue(DEFAULT_COMPRESSION_LEVEL)
+        settings_layout.addRow("Compression Level:", self.compression_level_spin_box)
+
+        self.pack_threshold_spin_box = QSpinBox()
+        self.pack_threshold_spin_box.setRange(0, 1024)
+        self.pack_threshold_spin_box.setSuffix(" KB")
+        self.pack_threshold_spin_box.setSpecialValueText("Off")
+        settings_layout.addRow("Pack Files Under:", self.pack_threshold_spin_box)
+
+        self.delta_threshold_spin_box = QSpinBox()
+        self.delta_threshold_spin_box.setRange(0, 1024 * 1024)
+        self.delta_threshold_spin_box.setSuffix(" MB")
+        self.delta_threshold_spin_box.setSpecialValueText("Off")
+        settings_layout.addRow("Copy Changes Only Over:", self.delta_threshold_spin_box)
+
+        self.compare_combo_box = QComboBox()
+        for compare, label in COMPARE_MODES.items():
+            self.compare_combo_box.addItem(label, compare)
+        settings_layout.addRow("Compare Files By:", self.compare_combo_box)
+
+        self.buffer_size_spin_box = QSpinBox()
+        self.buffer_size_spin_box.setRange(1, 256)
+        self.buffer_size_spin_box.setSuffix(" MB")
+        self.buffer_size_spin_box.setValue(DEFAULT_BUFFER_SIZE_MB)
+        settings_layout.addRow("Copy Buffer:", self.buffer_size_spin_box)
+
+        self.deletions_combo_box = QComboBox()
+        for deletions, label in DELETIONS.items():
+            self.deletions_combo_box.addItem(label, deletions)
+        settings_layout.addRow("Deleted Files (Mirror):", self.deletions_combo_box)
+
+        self.retention_edit = QLineEdit()
+        self.retention_edit.setPlaceholderText("All, or e.g. last=5 daily=7")
+        settings_layout.addRow("Keep Snapshots:", self.retention_edit)
+
+        self.log_skipped_check_box = QCheckBox("Log unchanged files")
+        self.log_skipped_check_box.setChecked(True)
+        settings_layout.addRow(self.log_skipped_check_box)
+
+        self.verify_check_box = QCheckBox("Verify copies")
+        settings_layout.addRow(self.verify_check_box)
+
+        self.change_journal_check_box = QCheckBox("Watch folders, back up only changes")
+        if not journal_supported():
+            self.change_journal_check_box.setEnabled(False)
+            self.change_journal_check_box.setToolTip("Needs Linux (inotify)")
+        settings_layout.addRow(self.change_journal_check_box)
+
+        self.low_priority_check_box = QCheckBox("Low CPU and disk priority")
+        settings_layout.addRow(self.low_priority_check_box)
+
+        self.debounce_spin_box = QSpinBox()
+        self.debounce_spin_box.setRange(1, 3600)
+        self.debounce_spin_box.setSuffix(" s")
+        self.debounce_spin_box.setToolTip("Continuous backups wait until files stopped changing for this long")
+        settings_layout.addRow("Quiet Time (Continuous):", self.debounce_spin_box)
+
+        self.max_lag_spin_box = QSpinBox()
+        self.max_lag_spin_box.setRange(1, 24 * 3600)
+        self.max_lag_spin_box.setSuffix(" s")
+        self.max_lag_spin_box.setToolTip("Continuous backups never wait longer than this after a change")
+        settings_layout.addRow("Max Lag (Continuous):", self.max_lag_spin_box)
+
+        self.settings_group.setLayout(settings_layout)
+        self.settings_group.setFixedWidth(300)
+
+        # Adding settings group to actions_info_layout
+        actions_info_layout.addWidget(self.settings_group)
+
+        # Info Group
+        self.info_group = QGroupBox("Info")
+        info_layout = QVBoxLayout()
+
+        self.destination_label = QLabel("Destination Folder: Not set")
+        self.total_files_label = QLabel("Total Files: 0")
+        self.total_folders_label = QLabel("Total Folders: 0")
+
+        open_log_button = QPushButton('Open Log File')
+        open_log_button.clicked.connect(self.open_log_file)
+
+        info_layout.addWidget(self.destination_label)
+        info_layout.addWidget(self.total_files_label)
+        info_layout.addWidget(self.total_folders_label)
+        info_layout.addWidget(open_log_button)
+        info_layout.addStretch()
+        self.info_group.setLayout(info_layout)
+        self.info_group.setFixedWidth(300)
+
+        # Adding info group to actions_info_layout
+        actions_info_layout.addWidget(self.info_group)
+
+        # Adding actions_info_layout to h_layout
+        h_layout.addLayout(actions_info_layout)
+
+        # Adding h_layout to main_layout
+        main_layout.addLayout(h_layout)
+
+        # Restore Group
+        self.restore_group = QGroupBox("Restore")
+        restore_layout = QHBoxLayout()
+
+        self.restore_patterns_edit = QLineEdit()
+        self.restore_patterns_edit.setPlaceholderText("All files, or patterns such as Documents/*.docx")
+        self.restore_target_label = QLabel("Restore To: Original location")
+        restore_to_button = QPushButton('Restore To...')
+        original_location_button = QPushButton('Original Location')
+        restore_button = QPushButton('Restore')
+
+        restore_layout.addWidget(QLabel("Include:"))
+        restore_layout.addWidget(self.restore_patterns_edit)
+        restore_layout.addWidget(self.restore_target_label)
+        restore_layout.addWidget(restore_to_button)
+        restore_layout.addWidget(original_location_button)
+        restore_layout.addWidget(restore_button)
+        self.restore_group.setLayout(restore_layout)
+        main_layout.addWidget(self.restore_group)
+
+        # Progress Group
+        progress_group = QGroupBox("Backup Progress")
+        progress_layout = QVBoxLayout()
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setTextVisible(True)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        progress_layout.addWidget(self.progress_bar)
+
+        self.status_label = QLabel("Status: Idle")
+        progress_layout.addWidget(self.status_label)
+
+        # Outside the settings, so the limit can be changed while a backup runs
+        throttle_layout = QHBoxLayout()
+        throttle_layout.addWidget(QLabel("Speed Limit:"))
+        self.throttle_edit = QLineEdit()
+        self.throttle_edit.setPlaceholderText("Unlimited, or e.g. 20MB/s 200ops/s; 08:00-18:00 5MB/s")
+        throttle_layout.addWidget(self.throttle_edit)
+        progress_layout.addLayout(throttle_layout)
+
+        progress_group.setLayout(progress_layout)
+        main_layout.addWidget(progress_group)
+
+        # Connect buttons to functions
+        add_file_button.clicked.connect(self.add_file)
+        add_folder_button.clicked.connect(self.add_folder)
+        remove_button.clicked.connect(self.remove_selected)
+        set_destination_button.clicked.connect(self.set_destination)
+        preview_button.clicked.connect(self.start_preview)
+        backup_button.clicked.connect(lambda: self.start_backup())  # clicked passes a checked flag, not a plan
+        self.continuous_button.clicked.connect(self.toggle_continuous)
+        new_profile_button.clicked.connect(self.new_profile)
+        delete_profile_button.clicked.connect(self.delete_profile)
+        self.schedule_edit.editingFinished.connect(self.check_schedule)
+        self.throttle_edit.editingFinished.connect(self.apply_throttle)
+        restore_to_button.clicked.connect(self.set_restore_folder)
+        original_location_button.clicked.connect(self.clear_restore_folder)
+        restore_button.clicked.connect(self.start_restore)
+
+        self.setLayout(main_layout)
+        self.setWindowTitle('Backup Utility')
+        self.setMinimumSize(960, 700)  # Set minimum size here
+        self.show()
+
+        # Increase font size for all widgets and set heading fonts
+        self.update_fonts()
+
+    def update_fonts(self):
+        font = QFont()
+        font.setPointSize(10)  # Adjust the font size as needed
+
+        # Set font for all widgets
+        self.list_widget.setFont(font)
+        self.destination_label.setFont(font)
+        self.total_files_label.setFont(font)
+        self.total_folders_label.setFont(font)
+        self.status_label.setFont(font)
+
+        # Set font for restore rows
+        for widget in self.restore_group.findChildren(QWidget):
+            widget.setFont(font)
+
+        # Set font for settings rows
+        for widget in self.settings_group.findChildren(QWidget):
+            widget.setFont(font)
+
+        # Set font for group headings
+        for group_box in self.findChildren(QGroupBox):
+            group_box.setFont(QFont(font.family(), font.pointSize() + 2))
+
+        # Set font for buttons
+        for button in self.findChildren(QPushButton):
+            button.setFont(font)
+
+        # Set font for progress bar
+        self.progress_bar.setFont(font)
+
+    def add_file(self):
+        options = QFileDialog.Options()
+        file, _ = QFileDialog.getOpenFileName(self, "Select File to Add", "", "All Files (*)", options=options)
+        if file:
+            self.list_widget.addItem(file)
+            self.update_info_labels()
+            self.update_watcher()
+
+    def add_folder(self):
+        options = QFileDialog.Options()
+        folder = QFileDialog.getExistingDirectory(self, "Select Folder to Add", options=options)
+        if folder:
+            self.list_widget.addItem(folder)
+            self.update_info_labels()
+            self.update_watcher()
+
+    def remove_selected(self):
+        selected_items = self.list_widget.selectedItems()
+        if not selected_items:
+            return
+        for item in selected_items:
+            self.list_widget.takeItem(self.list_widget.row(item))
+        self.update_info_labels()
+        self.update_watcher()
+
+    def set_destination(self):
+        options = QFileDialog.Options()
+        self.destination_folder = QFileDialog.getExistingDirectory(self, "Select Destination Folder", options=options)
+        if self.destination_folder:
+            self.destination_label.setText(f"Destination Folder: {self.destination_folder}")
+            QMessageBox.information(self, "Destination Set", f"Backup destination set to: {self.destination_folder}")
+
+    def backup_items(self):
+        # The items to back up, or None after telling the user what is missing
+        if not hasattr(self, 'destination_folder') or not self.destination_folder:
+            QMessageBox.warning(self, "No Destination", "Please set a backup destination first.")
+            return None
+
+        items = [self.list_widget.item(i).text() for i in range(self.list_widget.count())]
+        if not items:
+            QMessageBox.warning(self, "No Items", "Please add files or folders to backup.")
+            return None
+
+        try:
+            parse_retention(self.retention_edit.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid Retention Policy", str(e))
+            return None
+        try:
+            parse_throttle(self.throttle_edit.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid Speed Limit", str(e))
+            return None
+        return items
+
+    def start_backup(self, plan=None):
+        items = self.backup_items()
+        if items is None:
+            return
+        self.start_worker(EngineWorker("Backup", BackupEngine, items, self.destination_folder, plan=plan,
+                                       journal_file=journal_file(self.profile), **self.settings()),
+                          self.backup_complete)
+
+    def start_preview(self):
+        items = self.backup_items()
+        if items is None:
+            return
+        self.start_worker(EngineWorker("Preview", BackupEngine, items, self.destination_folder, action='make_plan',
+                                       **self.settings()),
+                          self.preview_complete)
+
+    def preview_complete(self):
+        self.progress_bar.setValue(100)
+        self.progress_bar.setFormat("%p%")
+        self.set_buttons_enabled(True)  # Re-enable all buttons
+        plan = self.worker.result
+        if plan is None:
+            QMessageBox.warning(self, "Preview Failed",
+                                f"Preview failed ({self.worker.error}). See the log for details.")
+            return
+
+        message_box = QMessageBox(self)
+        message_box.setWindowTitle("Backup Preview")
+        message_box.setText(plan_summary(plan))
+        backup_now_button = message_box.addButton("Back Up Now", QMessageBox.AcceptRole)
+        save_button = message_box.addButton("Save Plan...", QMessageBox.ActionRole)
+        message_box.addButton(QMessageBox.Close)
+        message_box.exec_()
+        if message_box.clickedButton() == backup_now_button:
+            self.start_backup(plan)  # Backs up what was previewed without walking the items again
+        elif message_box.clickedButton() == save_button:
+            options = QFileDialog.Options()
+            path, _ = QFileDialog.getSaveFileName(self, "Save Plan", "backup_plan.json", "JSON Files (*.json)",
+                                                  options=options)
+            if path:
+                save_plan(plan, path)
+
+    def set_restore_folder(self):
+        options = QFileDialog.Options()
+        folder = QFileDialog.getExistingDirectory(self, "Select Folder to Restore To", options=options)
+        if folder:
+            self.restore_folder = folder
+            self.restore_target_label.setText(f"Restore To: {folder}")
+
+    def clear_restore_folder(self):
+        self.restore_folder = None
+        self.restore_target_label.setText("Restore To: Original location")
+
+    def start_restore(self):
+        if not hasattr(self, 'destination_folder') or not self.destination_folder:
+            QMessageBox.warning(self, "No Destination", "Please set the backup destination to restore from first.")
+            return
+
+        restore_folder = getattr(self, 'restore_folder', None)
+        if not restore_folder:
+            answer = QMessageBox.question(self, "Restore to Original Location",
+                                          "Files that differ from the backup will be overwritten. Continue?")
+            if answer != QMessageBox.Yes:
+                return
+
+        items = [self.list_widget.item(i).text() for i in range(self.list_widget.count())]
+        patterns = self.restore_patterns_edit.text().split()
+        settings = self.settings()
+        worker = EngineWorker("Restore", RestoreEngine, self.destination_folder, items, restore_folder, patterns,
+                              workers=settings['workers'], mode=settings['mode'],
+                              buffer_size_mb=settings['buffer_size_mb'])
+        self.start_worker(worker, self.restore_complete)
+
+    def toggle_continuous(self):
+        if self.continuous_running():
+            self.continuous_button.setEnabled(False)
+            self.continuous_button.setText("Stopping...")
+            self.worker.engine.stop()  # Finishes the backup in progress first
+            return
+
+        items = self.backup_items()
+        if items is None:
+            return
+        if not journal_supported():
+            QMessageBox.warning(self, "Continuous Backup", "Continuous backup needs Linux (inotify).")
+            return
+        if self.watcher is not None:
+            self.watcher.stop()  # The continuous backup runs its own
+            self.watcher = None
+        try:
+            worker = EngineWorker("Continuous backup", ContinuousBackup, items, self.destination_folder,
+                                  journal_file=journal_file(self.profile), **self.continuous_settings(),
+                                  **self.settings())
+        except ValueError as e:
+            QMessageBox.warning(self, "Continuous Backup", str(e))
+            self.update_watcher()
+            return
+        self.start_worker(worker, self.continuous_complete)
+        self.continuous_button.setText("Stop Continuous Backup")
+        self.continuous_button.setEnabled(True)
+
+    def continuous_running(self):
+        return self.worker is not None and self.worker.isRunning() and isinstance(self.worker.engine, ContinuousBackup)
+
+    def continuous_complete(self):
+        self.progress_bar.setValue(100)
+        self.progress_bar.setFormat("%p%")
+        self.set_buttons_enabled(True)  # Re-enable all buttons
+        self.continuous_button.setText("Start Continuous Backup")
+        self.update_watcher()
+        if self.worker.error is not None:
+            QMessageBox.warning(self, "Continuous Backup Stopped",
+                                f"Continuous backup failed ({self.worker.error}). See the log for details.")
+
+    def start_worker(self, worker, on_completed):
+        self.set_buttons_enabled(False)  # Disable all buttons
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("%p%")
+
+        self.worker = worker
+        self.worker.progress_updated.connect(self.update_progress_bar)
+        self.worker.throughput_updated.connect(self.update_throughput)
+        self.worker.status_updated.connect(self.update_status_label)
+        self.worker.completed.connect(on_completed)
+        self.worker.start()
+
+    def update_progress_bar(self, progress):
+        self.progress_bar.setValue(progress)
+
+    def update_throughput(self, megabytes_per_second, eta_seconds):
+        eta = format_duration(eta_seconds) if eta_seconds >= 0 else "unknown"
+        self.progress_bar.setFormat(f"%p% - {megabytes_per_second:.1f} MB/s - ETA {eta}")
+
+    def update_status_label(self, status):
+        self.status_label.setText(status)
+
+    def set_buttons_enabled(self, enabled):
+        for button in self.findChildren(QPushButton):
+            button.setEnabled(enabled)
+        self.settings_group.setEnabled(enabled)
+        self.restore_group.setEnabled(enabled)
+
+    def backup_complete(self):
+        self.progress_bar.setValue(100)
+        self.progress_bar.setFormat("%p%")
+        self.set_buttons_enabled(True)  # Re-enable all buttons
+        if self.worker.error is not None:
+            QMessageBox.warning(self, "Backup Failed", f"Backup failed ({self.worker.error}). See the log for details.")
+        elif self.worker.result['failed'] or self.worker.result['mismatched']:
+            QMessageBox.warning(self, "Backup Incomplete",
+                                f"Backup finished with errors: {self.worker.engine.summary()}. "
+                                "See the log for the files concerned.")
+        else:
+            QMessageBox.information(self, "Backup Complete", "Backup completed successfully.")
+
+    def restore_complete(self):
+        self.progress_bar.setValue(100)
+        self.progress_bar.setFormat("%p%")
+        self.set_buttons_enabled(True)  # Re-enable all buttons
+        if self.worker.error is not None:
+            QMessageBox.warning(self, "Restore Failed",
+                                f"Restore failed ({self.worker.error}). See the log for details.")
+        else:
+            QMessageBox.information(self, "Restore Complete", "Restore completed. See the status line for the results.")
+
+    def update_watcher(self):
+        # Watches the listed folders for as long as the change journal is on, restarting with every change
+        # to the list or profile; each restart makes the next backup walk all items once
+        items = [self.list_widget.item(i).text() for i in range(self.list_widget.count())]
+        watched = (self.profile, items) if self.change_journal_check_box.isChecked() and journal_supported() else None
+        if watched == self.watched and (self.watcher is not None or watched is None):
+            return
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        self.watched = watched
+        if watched is not None:
+            self.watcher = JournalWatcher(items, journal_file(self.profile))
+            self.watcher.start()
+
+    def check_schedule(self):
+        try:
+            parse_schedule(self.schedule_edit.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid Schedule", str(e))
+
+    def apply_throttle(self):
+        try:
+            parse_throttle(self.throttle_edit.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid Speed Limit", str(e))
+            return
+        if self.worker is not None and self.worker.isRunning() and hasattr(self.worker.engine, 'set_throttle'):
+            self.worker.engine.set_throttle(self.throttle_edit.text().strip())
+
+    def switch_profile(self, index):
+        name = self.profile_combo_box.itemText(index)
+        if not name or name == self.profile:
+            return
+        if self.profile in self.profiles:
+            self.profiles[self.profile] = self.current_config()
+        self.show_profile(name)
+        self.update_watcher()
+
+    def new_profile(self):
+        name, ok = QInputDialog.getText(self, "New Profile", "Profile name:")
+        name = name.strip()
+        if not ok or not name:
+            return
+        if name in self.profiles:
+            QMessageBox.warning(self, "New Profile", f"There is already a profile named {name}.")
+            return
+        # Starts with the current settings, but nothing to back up yet
+        self.profiles[name] = dict(self.current_config(), items=[], destination_folder='', schedule='')
+        self.profile_combo_box.addItem(name)
+        self.profile_combo_box.setCurrentText(name)
+
+    def delete_profile(self):
+        if self.profile == DEFAULT_PROFILE:
+            QMessageBox.warning(self, "Delete Profile", f"The {DEFAULT_PROFILE} profile cannot be deleted.")
+            return
+        reply = QMessageBox.question(self, "Delete Profile", f"Delete the profile {self.profile}?",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        del self.profiles[self.profile]  # Not saved again when switching away below
+        self.profile_combo_box.removeItem(self.profile_combo_box.currentIndex())
+
+    def closeEvent(self, event):
+        self.save_data()
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self.continuous_running():
+            self.worker.engine.stop()
+            self.worker.wait()
+        stop_logging(self.log_listener)
+        event.accept()
+
+    def settings(self):
+        return {
+            'workers': self.workers_spin_box.value(),
+            'mode': self.mode_combo_box.currentData(),
+            'log_skipped': self.log_skipped_check_box.isChecked(),
+            'buffer_size_mb': self.buffer_size_spin_box.value(),
+            'compare': self.compare_combo_box.currentData(),
+            'verify': self.verify_check_box.isChecked(),
+            'compression_level': self.compression_level_spin_box.value(),
+            'pack_threshold_kb': self.pack_threshold_spin_box.value(),
+            'delta_threshold_mb': self.delta_threshold_spin_box.value(),
+            'retention': self.retention_edit.text().strip(),
+            'deletions': self.deletions_combo_box.currentData(),
+            'change_journal': self.change_journal_check_box.isChecked(),
+            'throttle': self.throttle_edit.text().strip(),
+            'low_priority': self.low_priority_check_box.isChecked()
+        }
+
+    def continuous_settings(self):
+        return {
+            'debounce_seconds': self.debounce_spin_box.value(),
+            'max_lag_seconds': self.max_lag_spin_box.value()
+        }
+
+    def current_config(self):
+        items = [self.list_widget.item(i).text() for i in range(self.list_widget.count())]
+        config = {
+            'items': items,
+            'destination_folder': getattr(self, 'destination_folder', ''),
+            'schedule': self.schedule_edit.text().strip()
+        }
+        config.update(self.settings())
+        config.update(self.continuous_settings())
+        return config
+
+    def save_data(self):
+        self.profiles[self.profile] = self.current_config()
+        save_profiles(self.profiles)
+
+    def load_data(self):
+        self.profiles = load_profiles()
+        self.profile = None
+        self.profile_combo_box.addItems(list(self.profiles))
+        self.show_profile(DEFAULT_PROFILE)
+        self.profile_combo_box.currentIndexChanged.connect(self.switch_profile)  # Not while filling it
+
+    def show_profile(self, name):
+        self.profile = name
+        config = self.profiles[name]
+        self.list_widget.clear()
+        for item in config['items']:
+            self.list_widget.addItem(item)
+        self.destination_folder = config['destination_folder']
+        self.destination_label.setText(f"Destination Folder: {self.destination_folder or 'Not set'}")
+        self.schedule_edit.setText(config['schedule'])
+        self.workers_spin_box.setValue(config['workers'])
+        self.mode_combo_box.setCurrentIndex(max(0, self.mode_combo_box.findData(config['mode'])))
+        self.log_skipped_check_box.setChecked(config['log_skipped'])
+        self.buffer_size_spin_box.setValue(config['buffer_size_mb'])
+        self.compare_combo_box.setCurrentIndex(max(0, self.compare_combo_box.findData(config['compare'])))
+        self.verify_check_box.setChecked(config['verify'])
+        self.compression_level_spin_box.setValue(config['compression_level'])
+        self.pack_threshold_spin_box.setValue(config['pack_threshold_kb'])
+        self.delta_threshold_spin_box.setValue(config['delta_threshold_mb'])
+        self.retention_edit.setText(config['retention'])
+        self.deletions_combo_box.setCurrentIndex(max(0, self.deletions_combo_box.findData(config['deletions'])))
+        self.change_journal_check_box.setChecked(config['change_journal'] and journal_supported())
+        self.throttle_edit.setText(config['throttle'])
+        self.low_priority_check_box.setChecked(config['low_priority'])
+        self.debounce_spin_box.setValue(config['debounce_seconds'])
+        self.max_lag_spin_box.setValue(config['max_lag_seconds'])
+        self.update_info_labels()
+
+    def update_info_labels(self):
+        total_files = 0
+        total_folders = 0
+
+        for i in range(self.list_widget.count()):
+            item_path = self.list_widget.item(i).text()
+            if os.path.isfile(item_path):
+                total_files += 1
+            elif os.path.isdir(item_path):
+                total_folders += 1
+
+        self.total_files_label.setText(f"Total Files: {total_files}")
+        self.total_folders_label.setText(f"Total Folders: {total_folders}")
+
+    def open_log_file(self):
+        try:
+            os.startfile(LOG_FILE_NAME)  # Opens the log file using the default application
+        except OSError as e:
+            QMessageBox.warning(self, "Error Opening Log File", f"Failed to open log file: {e}")
+
+
+def main():
+    app = QApplication(sys.argv)
+    backup_utility = BackupUtility()
+    return app.exec_()
@@ -0,0 +1,26 @@
+import hashlib
+import os
+
+
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def new_hash():
+    # BLAKE2b is the fastest hash in the standard library; 128 bits is plenty to tell copies apart
+    return hashlib.blake2b(digest_size=16)
+
+
+def hash_file(path, drop_cache=False):
+    digest = new_hash()
+    buffer = memoryview(bytearray(HASH_BUFFER_SIZE))
+    with open(path, 'rb', buffering=0) as f:
+        if drop_cache and hasattr(os, 'posix_fadvise'):
+            # Write the file out and evict it from the page cache so it is read back from the disk
+            os.fsync(f.fileno())
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        while True:
+            length = f.readinto(buffer)
+            if not length:
+                break
+            digest.update(buffer[:length])
+    return digest.hexdigest()
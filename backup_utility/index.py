@@ -0,0 +1,110 @@
+import logging
+import os
+import sqlite3
+import threading
+from urllib.request import pathname2url
+
+
+INDEX_FILE_NAME = '.backup_index.db'  # File-state index kept in the destination folder
+INDEX_SAVE_INTERVAL = 5000  # Index updates buffered before they are written out
+
+
+class FileIndex:
+    # Source size, mtime_ns and inode of every file already backed up, keyed on its
+    # path relative to the destination, so unchanged files never touch the destination.
+    # When files are compared by content the hash of the copied data is kept as well,
+    # so it only has to be recomputed when the metadata changes.
+    # A read_only index (for dry runs) keeps what is recorded in memory and never touches the file.
+    def __init__(self, destination_folder, read_only=False):
+        self.path = os.path.join(destination_folder, INDEX_FILE_NAME)
+        self.read_only = read_only
+        self.entries = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return  # Created when the first entries are saved
+        try:
+            if self.read_only:
+                connection = sqlite3.connect(f"file:{pathname2url(self.path)}?mode=ro", uri=True)
+            else:
+                connection = sqlite3.connect(self.path)
+            try:
+                if not self.read_only:
+                    self.create_table(connection)
+                columns = [row[1] for row in connection.execute('PRAGMA table_info(files)')]
+                hash_column = 'hash'
+                if 'hash' not in columns:  # Index written before content hashes were kept
+                    if self.read_only:
+                        hash_column = 'NULL'
+                    else:
+                        connection.execute('ALTER TABLE files ADD COLUMN hash TEXT')
+                for path, size, mtime_ns, inode, content_hash in connection.execute(
+                        f'SELECT path, size, mtime_ns, inode, {hash_column} FROM files'):
+                    self.entries[path] = (size, mtime_ns, inode, content_hash)
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            logging.warning(f"File index unavailable at {self.path} ({e})")
+            self.path = None
+
+    def create_table(self, connection):
+        connection.execute('CREATE TABLE IF NOT EXISTS files '
+                           '(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, hash TEXT)')
+
+    def is_unchanged(self, key, file_stat):
+        entry = self.entries.get(key)
+        return entry is not None and entry[:3] == (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+
+    def content_hash(self, key):
+        entry = self.entries.get(key)
+        return entry[3] if entry is not None else None
+
+    def record(self, key, file_stat, content_hash=None):
+        state = (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, content_hash)
+        with self.lock:
+            self.entries[key] = state
+            self.pending[key] = state
+            if len(self.pending) >= INDEX_SAVE_INTERVAL:
+                self.flush()
+
+    def is_indexed(self, key):
+        return key in self.entries
+
+    def invalidate(self, key):
+        # Keeps the entry but makes it match no file, so the next run copies the file again
+        state = (-1, -1, -1, None)
+        with self.lock:
+            self.entries[key] = state
+            self.pending[key] = state
+
+    def remove(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.pending[key] = None
+
+    def save(self):
+        with self.lock:
+            self.flush()
+
+    def flush(self):
+        if not self.pending or self.path is None or self.read_only:
+            self.pending = {}
+            return
+        try:
+            connection = sqlite3.connect(self.path)
+            try:
+                with connection:
+                    self.create_table(connection)
+                    connection.executemany('INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, hash) '
+                                           'VALUES (?, ?, ?, ?, ?)',
+                                           [(path,) + state for path, state in self.pending.items() if state])
+                    connection.executemany('DELETE FROM files WHERE path = ?',
+                                           [(path,) for path, state in self.pending.items() if state is None])
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            logging.warning(f"Failed to save file index {self.path} ({e})")
+        self.pending = {}
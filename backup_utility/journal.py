@@ -0,0 +1,338 @@
+import ctypes
+import ctypes.util
+import errno
+import json
+import logging
+import os
+import select
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows, which has no inotify either
+    fcntl = None
+
+
+JOURNAL_FILE_NAME = 'backup_journal.db'  # Paths changed since the last backup, kept next to the settings file
+JOURNAL_FLUSH_INTERVAL = 1.0  # Seconds changed paths are collected before they are written to the journal
+EVENT_BUFFER_SIZE = 64 * 1024  # Bytes of inotify events read at once
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_DONT_FOLLOW = 0x2000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = getattr(os, 'O_NONBLOCK', 0)  # Missing on Windows, which has no inotify
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie and name length of each event, followed by the name
+
+
+def load_libc():
+    if not sys.platform.startswith('linux'):
+        return None  # inotify is Linux only; find_library('c') is None on Windows
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError, TypeError):
+        return None
+    return libc
+
+
+libc = load_libc()
+
+
+def journal_supported():
+    return sys.platform.startswith('linux') and libc is not None and fcntl is not None
+
+
+class Inotify:
+    # Minimal ctypes binding to the Linux inotify API
+    def __init__(self):
+        if libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available on this system")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path, mask):
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def rm_watch(self, wd):
+        libc.inotify_rm_watch(self.fd, wd)  # Fails harmlessly for watches the kernel already dropped
+
+    def read_events(self):
+        # Yields (wd, mask, name) for every queued event
+        try:
+            data = os.read(self.fd, EVENT_BUFFER_SIZE)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            yield wd, mask, os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ChangeJournal:
+    # Source paths changed since the last backup, recorded by a JournalWatcher and read by the engine.
+    # Every watcher session covers all changes from the moment its watches were set up, so once a
+    # backup walked the whole tree during a session, the next ones only need the paths recorded since.
+    def __init__(self, path=JOURNAL_FILE_NAME):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.lock_file = None
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')  # The engine reads while the watcher writes
+        connection.execute('CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT)')
+        connection.execute('CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value TEXT)')
+        return connection
+
+    def acquire(self):
+        # Held by the watcher while it records, so the engine can tell whether anything is recording
+        self.lock_file = open(self.lock_path, 'w')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_file.close()
+            self.lock_file = None
+            raise RuntimeError(f"Another watcher is already recording changes in {self.path}")
+
+    def release(self):
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def is_watched(self):
+        if fcntl is None or not os.path.exists(self.lock_path):
+            return False
+        with open(self.lock_path, 'r') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+        return False
+
+    def start_session(self, connection, folders):
+        session = uuid.uuid4().hex
+        connection.execute('BEGIN IMMEDIATE')
+        connection.executemany('INSERT OR REPLACE INTO state VALUES (?, ?)',
+                               [('session', session), ('folders', json.dumps(folders))])
+        connection.execute('COMMIT')
+        return session
+
+    def end_session(self, connection):
+        connection.execute("DELETE FROM state WHERE name = 'session'")
+
+    def record(self, connection, paths):
+        connection.execute('BEGIN IMMEDIATE')
+        connection.executemany('INSERT INTO changes (path) VALUES (?)', [(path,) for path in paths])
+        connection.execute('COMMIT')
+
+    def checkpoint(self, target):
+        # Where a backup to target starts in the journal, or None when no watcher is recording.
+        # 'synced' tells whether the session saw every change since the last backup to target.
+        if not os.path.exists(self.path) or not self.is_watched():
+            return None
+        connection = self.connect()
+        try:
+            connection.execute('BEGIN')  # The session and the last change are read together
+            state = dict(connection.execute('SELECT name, value FROM state'))
+            last_seq = connection.execute('SELECT MAX(seq) FROM changes').fetchone()[0] or 0
+            connection.execute('COMMIT')
+        finally:
+            connection.close()
+        session = state.get('session')
+        if not session:
+            return None
+        return {'session': session, 'last_seq': last_seq, 'folders': json.loads(state['folders']),
+                'synced': state.get('synced') == json.dumps([session, target])}
+
+    def changes(self, checkpoint):
+        connection = self.connect()
+        try:
+            return [path for path, in connection.execute('SELECT DISTINCT path FROM changes WHERE seq <= ?',
+                                                         (checkpoint['last_seq'],))]
+        finally:
+            connection.close()
+
+    def commit(self, checkpoint, target):
+        # Called after a complete backup to target: the changes up to the checkpoint are backed up.
+        # Returns False when the session ended meanwhile, and the next backup has to walk everything.
+        if not self.is_watched():
+            return False
+        connection = self.connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            session = connection.execute("SELECT value FROM state WHERE name = 'session'").fetchone()
+            if session is None or session[0] != checkpoint['session']:
+                connection.execute('ROLLBACK')
+                return False
+            connection.execute('DELETE FROM changes WHERE seq <= ?', (checkpoint['last_seq'],))
+            connection.execute('INSERT OR REPLACE INTO state VALUES (?, ?)',
+                               ('synced', json.dumps([checkpoint['session'], target])))
+            connection.execute('COMMIT')
+            return True
+        finally:
+            connection.close()
+
+
+class JournalWatcher:
+    # Records the paths changed below the watched folders in a ChangeJournal until stopped,
+    # either on a background thread (start/stop) or on the calling thread (run).
+    # on_recorded is called on the watcher's thread whenever changes were written to the journal.
+    def __init__(self, items, journal_file=JOURNAL_FILE_NAME, on_status=None, on_recorded=None):
+        self.folders = [item for item in items if os.path.isdir(item)]  # Files are stat'ed on every run anyway
+        self.journal = ChangeJournal(journal_file)
+        self.on_status = on_status or (lambda message: None)
+        self.on_recorded = on_recorded or (lambda: None)
+        self.ready = threading.Event()  # Set once every change is recorded
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.watches = {}  # Watch descriptor -> watched folder
+        self.pending = set()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.watch, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def watch(self):
+        try:
+            self.run()
+        except Exception as e:
+            self.on_status(f"Stopped watching for changes ({e})")
+            logging.warning(f"Stopped watching for changes ({e})")
+
+    def run(self):
+        self.journal.acquire()
+        connection = self.journal.connect()
+        inotify = None
+        try:
+            inotify = Inotify()
+            for folder in self.folders:
+                self.watch_tree(inotify, folder)
+            # Only now is every change recorded, so earlier sessions' backups no longer count
+            session = self.journal.start_session(connection, self.folders)
+            self.ready.set()
+            self.on_status(f"Watching {len(self.watches)} folders for changes")
+            logging.info(f"Watching {len(self.watches)} folders for changes, session {session}")
+
+            last_flush = time.monotonic()
+            while not self.stop_event.is_set():
+                ready, _, _ = select.select([inotify.fd], [], [], JOURNAL_FLUSH_INTERVAL)
+                if ready and self.read_events(inotify):
+                    self.flush(connection)
+                    session = self.journal.start_session(connection, self.folders)
+                    logging.warning(f"Change events were lost, the next backup walks all folders (session {session})")
+                    self.on_recorded()
+                if self.pending and time.monotonic() - last_flush >= JOURNAL_FLUSH_INTERVAL:
+                    self.flush(connection)
+                    last_flush = time.monotonic()
+        finally:
+            try:
+                self.flush(connection)
+                self.journal.end_session(connection)
+            finally:
+                connection.close()
+                if inotify is not None:
+                    inotify.close()
+                self.journal.release()
+            logging.info("Stopped watching for changes")
+
+    def read_events(self, inotify):
+        # Collects the changed paths; returns True if the kernel dropped events
+        overflowed = False
+        for wd, mask, name in inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                overflowed = True
+                continue
+            folder = self.watches.get(wd)
+            if folder is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                continue
+            if not name:
+                continue  # About the watched folder itself, which its parent reports as well
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                # A new folder's contents may predate its watch, so the whole folder is backed up
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.watch_tree(inotify, path)
+                    self.pending.add(path)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.unwatch_tree(inotify, path)
+                    self.pending.add(path)
+            else:
+                self.pending.add(path)
+        return overflowed
+
+    def watch_tree(self, inotify, root):
+        pending = [root]
+        while pending:
+            folder = pending.pop()
+            try:
+                wd = inotify.add_watch(folder, WATCH_MASK)
+            except OSError as e:
+                if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                    continue  # Gone again
+                if e.errno == errno.EACCES:
+                    logging.warning(f"Not watching {folder} ({e})")  # Skipped by the backup as well
+                    continue
+                if e.errno == errno.ENOSPC:
+                    raise OSError(e.errno, "Too many folders to watch, raise fs.inotify.max_user_watches")
+                raise
+            self.watches[wd] = folder
+            try:
+                with os.scandir(folder) as entries:
+                    pending.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+
+    def unwatch_tree(self, inotify, root):
+        # A folder moved away keeps its watches, which would report changes under its old path
+        prefix = root + os.sep
+        for wd, folder in list(self.watches.items()):
+            if folder == root or folder.startswith(prefix):
+                inotify.rm_watch(wd)
+                del self.watches[wd]
+
+    def flush(self, connection):
+        if self.pending:
+            self.journal.record(connection, self.pending)
+            self.pending = set()
+            self.on_recorded()
@@ -0,0 +1,87 @@
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+LOG_FILE_NAME = 'backup.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Size at which backup.log is rotated
+LOG_BACKUP_COUNT = 5  # Rotated logs kept as backup.log.1 ... backup.log.5
+LOG_BATCH_SIZE = 500  # Records buffered before they are written in one go
+LOG_FLUSH_INTERVAL = 1.0  # Seconds of quiet after which buffered records are written
+
+
+class BatchedRotatingFileHandler(RotatingFileHandler):
+    # Collects formatted records and writes each batch with a single call. The file
+    # size is tracked in memory, so rotation needs no seek or stat per record.
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.batch = []
+        self.size = os.path.getsize(self.baseFilename) if os.path.isfile(self.baseFilename) else 0
+
+    def emit(self, record):
+        try:
+            self.batch.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.batch) >= LOG_BATCH_SIZE or record.levelno >= logging.WARNING:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if not self.batch:
+                return
+            data = ''.join(self.batch).encode('utf-8')
+            self.batch = []
+            if self.maxBytes and self.size and self.size + len(data) > self.maxBytes:
+                self.doRollover()
+                self.size = 0
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.buffer.write(data)
+            self.stream.flush()
+            self.size += len(data)
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+class FlushingQueueListener(QueueListener):
+    # Writes out the handlers' batches whenever the queue has been quiet for a while
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(timeout=LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
+
+
+def setup_logging(log_file=LOG_FILE_NAME):
+    # Records are only queued by the calling thread; a listener thread formats
+    # them into the log file in batches
+    file_handler = BatchedRotatingFileHandler(log_file, LOG_MAX_BYTES, LOG_BACKUP_COUNT)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    log_queue = queue.SimpleQueue()
+    listener = FlushingQueueListener(log_queue, file_handler)
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(QueueHandler(log_queue))
+    listener.start()
+    return listener
+
+
+def stop_logging(listener):
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        if isinstance(handler, QueueHandler) and handler.queue is listener.queue:
+            root_logger.removeHandler(handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
@@ -0,0 +1,149 @@
+import logging
+import os
+import sqlite3
+import threading
+
+
+PACKS_FOLDER_NAME = '.packs'
+PACK_INDEX_FILE_NAME = 'index.db'
+PACK_MAX_SIZE = 64 * 1024 * 1024  # A new pack file is started once the current one reaches this size
+PACK_INDEX_SAVE_INTERVAL = 5000  # Packed files buffered before the pack is synced and the index written
+UNREADABLE_SUFFIX = '.unreadable'  # Added to a pack index that could not be read when a new one replaces it
+
+
+class PackStore:
+    # Small files are appended to shared pack files instead of being created one by
+    # one in the destination, turning many small creates into a few large sequential
+    # writes. The index maps each file's destination-relative path to its bytes.
+    def __init__(self, destination_folder):
+        self.path = os.path.join(destination_folder, PACKS_FOLDER_NAME)
+        self.index_path = os.path.join(self.path, PACK_INDEX_FILE_NAME)
+        self.entries = {}
+        self.pending = {}
+        self.pack_file = None
+        self.pack_name = None
+        self.lock = threading.Lock()
+        self.unreadable = False  # The index could not be read; it is set aside before a new one is written
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.index_path):
+            return  # Created with the first pack
+        try:
+            connection = sqlite3.connect(self.index_path)
+            try:
+                self.create_table(connection)
+                for path, pack, offset, length, mtime_ns in connection.execute(
+                        'SELECT path, pack, offset, length, mtime_ns FROM packed'):
+                    self.entries[path] = (pack, offset, length, mtime_ns)
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            # Nothing counts as packed then, so a backup packs the files again
+            logging.warning(f"Pack index unavailable at {self.index_path} ({e})")
+            self.entries = {}
+            self.unreadable = True
+
+    def create_table(self, connection):
+        connection.execute('CREATE TABLE IF NOT EXISTS packed (path TEXT PRIMARY KEY, pack TEXT, '
+                           'offset INTEGER, length INTEGER, mtime_ns INTEGER)')
+
+    def contains(self, key):
+        return self.entries.get(key) is not None
+
+    def add(self, key, file_path, file_stat):
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        with self.lock:
+            if self.pack_file is None or self.pack_file.tell() >= PACK_MAX_SIZE:
+                self.open_next_pack()
+            offset = self.pack_file.tell()
+            self.pack_file.write(data)
+            entry = (self.pack_name, offset, len(data), file_stat.st_mtime_ns)
+            self.entries[key] = entry
+            self.pending[key] = entry
+            if len(self.pending) >= PACK_INDEX_SAVE_INTERVAL:
+                self.flush()
+        return len(data)
+
+    def forget(self, key):
+        # The file is now stored on its own, so its packed copy is out of date
+        with self.lock:
+            if self.entries.get(key) is not None:
+                self.entries[key] = None
+                self.pending[key] = None
+
+    def open_next_pack(self):
+        if self.pack_file is not None:
+            self.sync_pack()
+            self.pack_file.close()
+        os.makedirs(self.path, exist_ok=True)
+        number = len([name for name in os.listdir(self.path) if name.endswith('.pack')]) + 1
+        while os.path.exists(os.path.join(self.path, f"pack-{number:06d}.pack")):
+            number += 1
+        self.pack_name = f"pack-{number:06d}.pack"
+        self.pack_file = open(os.path.join(self.path, self.pack_name), 'xb')
+
+    def sync_pack(self):
+        self.pack_file.flush()
+        os.fsync(self.pack_file.fileno())
+
+    def flush(self):
+        # The pack data is synced first so the index never points at bytes that are not on disk
+        if not self.pending:
+            return
+        if self.pack_file is not None:
+            self.sync_pack()
+        if self.unreadable:
+            self.set_aside_index()
+        try:
+            connection = sqlite3.connect(self.index_path)
+            try:
+                with connection:
+                    self.create_table(connection)
+                    connection.executemany('INSERT OR REPLACE INTO packed (path, pack, offset, length, mtime_ns) '
+                                           'VALUES (?, ?, ?, ?, ?)',
+                                           [(path,) + entry for path, entry in self.pending.items() if entry])
+                    connection.executemany('DELETE FROM packed WHERE path = ?',
+                                           [(path,) for path, entry in self.pending.items() if entry is None])
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            logging.warning(f"Failed to save pack index {self.index_path} ({e})")
+        self.pending = {}
+
+    def set_aside_index(self):
+        # Kept next to the new index rather than deleted, in case it can still be repaired
+        try:
+            os.replace(self.index_path, self.index_path + UNREADABLE_SUFFIX)
+            logging.warning(f"Moved the unreadable pack index to {self.index_path + UNREADABLE_SUFFIX}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Failed to move the unreadable pack index {self.index_path} ({e})")
+        self.unreadable = False
+
+    def save(self):
+        with self.lock:
+            self.flush()
+            if self.pack_file is not None:
+                self.pack_file.close()
+                self.pack_file = None
+
+    def checkpoint(self):
+        # Saves the index of what was packed so far, keeping the current pack open
+        with self.lock:
+            self.flush()
+
+    def read(self, key):
+        pack, offset, length, _ = self.entries[key]
+        with open(os.path.join(self.path, pack), 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def extract(self, key, target_path):
+        # Restores one packed file on demand, including its modification time
+        _, _, _, mtime_ns = self.entries[key]
+        with open(target_path, 'wb') as f:
+            f.write(self.read(key))
+        os.utime(target_path, ns=(mtime_ns, mtime_ns))
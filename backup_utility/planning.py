@@ -0,0 +1,82 @@
+import json
+import time
+
+from .progress import format_size
+
+
+# What a plan says will happen to each path
+ACTION_COPY = 'copy'  # Copied in full
+ACTION_UPDATE = 'update'  # Only the changed parts written (delta copy)
+ACTION_PACK = 'pack'  # Appended to a pack file
+ACTION_STORE = 'store'  # Added to the repository or archive
+ACTION_LINK = 'link'  # Unchanged, hard-linked into the new snapshot
+ACTION_SKIP = 'skip'  # Unchanged
+ACTION_CREATE = 'create'  # Folder created in the destination
+ACTION_DELETE = 'delete'  # Deleted from the source, removed or quarantined in the destination
+ACTION_LABELS = {
+    ACTION_COPY: "to copy", ACTION_UPDATE: "to update", ACTION_PACK: "to pack", ACTION_STORE: "to store",
+    ACTION_LINK: "to link", ACTION_SKIP: "unchanged", ACTION_CREATE: "folders to create",
+    ACTION_DELETE: "to remove",
+}
+
+
+class PlannedStat:
+    # The parts of os.stat_result the engine uses, as saved in a plan
+    def __init__(self, st_mode, st_size, st_mtime_ns, st_ino):
+        self.st_mode = st_mode
+        self.st_size = st_size
+        self.st_mtime_ns = st_mtime_ns
+        self.st_ino = st_ino
+        seconds, nanoseconds = divmod(st_mtime_ns, 1000000000)
+        self.st_mtime = seconds + nanoseconds * 1e-9  # Computed the way os.stat does
+
+
+def stat_fields(file_stat):
+    return [file_stat.st_mode, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino]
+
+
+def new_plan(destination_folder, mode):
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'destination_folder': destination_folder,
+        'mode': mode,
+        'items': [],
+        'totals': {action: {'count': 0, 'bytes': 0} for action in ACTION_LABELS}
+    }
+
+
+def add_to_totals(plan, action, size=0):
+    totals = plan['totals'][action]
+    totals['count'] += 1
+    totals['bytes'] += size
+
+
+def planned_items(plan):
+    # The scanned items of a saved plan, in the form BackupEngine.scan_items returns
+    scanned_items = []
+    for item in plan['items']:
+        entries = item['entries']
+        if entries is not None:
+            entries = [(relative_path, PlannedStat(*fields)) for relative_path, _, *fields in entries]
+        scanned_items.append((item['path'], PlannedStat(*item['stat']), entries))
+    return scanned_items
+
+
+def plan_summary(plan):
+    parts = []
+    for action, label in ACTION_LABELS.items():
+        totals = plan['totals'][action]
+        if totals['count']:
+            size = f" ({format_size(totals['bytes'])})" if totals['bytes'] else ""
+            parts.append(f"{totals['count']} {label}{size}")
+    return ", ".join(parts) or "Nothing to back up"
+
+
+def save_plan(plan, path):
+    with open(path, 'w') as f:
+        json.dump(plan, f)
+
+
+def load_plan(path):
+    with open(path, 'r') as f:
+        return json.load(f)
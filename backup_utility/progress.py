@@ -0,0 +1,81 @@
+import threading
+import time
+
+
+UPDATE_INTERVAL = 0.05  # Seconds between coalesced progress and status updates (20 Hz)
+
+
+def format_size(size):
+    if size < 1024:
+        return f"{size} B"
+    for unit in ('KB', 'MB', 'GB', 'TB'):
+        size /= 1024
+        if size < 1024 or unit == 'TB':
+            return f"{size:.1f} {unit}"
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class ProgressReporter:
+    # Counts the files and bytes done and reports them through the optional callbacks
+    # on_progress(percent), on_throughput(megabytes_per_second, eta_seconds or -1) and
+    # on_status(message), which are called from the worker threads
+    def __init__(self, on_progress=None, on_throughput=None, on_status=None):
+        self.on_progress = on_progress or (lambda progress: None)
+        self.on_throughput = on_throughput or (lambda megabytes_per_second, eta_seconds: None)
+        self.on_status = on_status or (lambda status: None)
+        self.progress_lock = threading.Lock()
+        self.outcomes = {'copied': 0, 'skipped': 0, 'failed': 0, 'mismatched': 0, 'deleted': 0}
+
+    def start_progress(self, total_files, total_bytes, message):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.done_files = 0
+        self.done_bytes = 0  # Copied plus skipped, drives the progress bar and ETA
+        self.copied_bytes = 0  # Actually written, drives MB/s
+        self.start_time = time.monotonic()
+        self.next_update_time = self.start_time
+        self.report_status(message, force=True)
+
+    def advance_progress(self, processed_bytes, copied_bytes, files=0):
+        with self.progress_lock:
+            self.done_files += files
+            self.done_bytes += processed_bytes
+            self.copied_bytes += copied_bytes
+            self.emit_updates()
+
+    def report_status(self, message, outcome=None, force=False):
+        # Per-file messages only set the latest status; it is shown with the running
+        # counts at most once per UPDATE_INTERVAL so the window or console is not flooded
+        with self.progress_lock:
+            self.latest_status = message
+            if outcome is not None:
+                self.outcomes[outcome] += 1
+            self.emit_updates(force)
+
+    def emit_updates(self, force=False):
+        now = time.monotonic()
+        if not force and now < self.next_update_time:
+            return
+        self.next_update_time = now + UPDATE_INTERVAL
+
+        if self.total_bytes:
+            progress = self.done_bytes * 100 // self.total_bytes
+        else:
+            progress = self.done_files * 100 // max(1, self.total_files)
+        elapsed = max(now - self.start_time, 1e-6)
+        processed_rate = self.done_bytes / elapsed
+        eta = max(self.total_bytes - self.done_bytes, 0) / processed_rate if processed_rate else -1
+        megabytes_per_second = self.copied_bytes / elapsed / (1024 * 1024)
+
+        self.on_progress(min(int(progress), 100))
+        self.on_throughput(megabytes_per_second, eta)
+        self.on_status(f"{self.latest_status} | {self.summary()}")
+
+    def summary(self):
+        return (f"{self.outcomes['copied']} copied, {self.outcomes['skipped']} unchanged, "
+                f"{self.outcomes['failed']} failed")
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+
+
+REPOSITORY_FOLDER_NAME = 'repository'
+CHUNK_MIN_SIZE = 256 * 1024
+CHUNK_MAX_SIZE = 4 * 1024 * 1024
+CHUNK_READ_SIZE = 2 * CHUNK_MAX_SIZE
+CHUNK_ANCHOR = b'\n'  # Boundary candidates; line ends in text, about 1 in 256 bytes in binary data
+CHUNK_WINDOW = 48  # Bytes hashed before a candidate to decide whether it is a boundary
+CHUNK_MASK = (1 << 12) - 1  # One candidate in 4096 becomes a boundary
+
+
+def find_chunk_end(data, start):
+    # Content-defined boundary: the first anchor byte past the minimum size whose
+    # preceding window hashes to zero under the mask, so an insertion only moves
+    # the boundaries next to it. The searching and hashing both run in C.
+    limit = min(len(data), start + CHUNK_MAX_SIZE)
+    position = data.find(CHUNK_ANCHOR, start + CHUNK_MIN_SIZE, limit)
+    while position != -1:
+        if not zlib.crc32(data[position - CHUNK_WINDOW:position]) & CHUNK_MASK:
+            return position + 1
+        position = data.find(CHUNK_ANCHOR, position + 1, limit)
+    return limit
+
+
+def read_chunks(file):
+    data = b''
+    start = 0
+    eof = False
+    while start < len(data) or not eof:
+        if not eof and len(data) - start < CHUNK_MAX_SIZE:
+            block = file.read(CHUNK_READ_SIZE)
+            if block:
+                data = data[start:] + block
+                start = 0
+            else:
+                eof = True
+            continue
+        end = find_chunk_end(data, start)
+        yield data[start:end]
+        start = end
+
+
+class ChunkRepository:
+    # Every unique chunk is stored once under its SHA-256, and the manifest lists
+    # the chunks making up each file together with the source size and mtime_ns
+    def __init__(self, destination_folder):
+        self.path = os.path.join(destination_folder, REPOSITORY_FOLDER_NAME)
+        self.chunks_path = os.path.join(self.path, 'chunks')
+        self.manifest_path = os.path.join(self.path, 'manifest.json')
+        self.lock = threading.Lock()
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+
+    def is_unchanged(self, key, file_stat):
+        entry = self.manifest.get(key)
+        return entry is not None and entry['size'] == file_stat.st_size and entry['mtime_ns'] == file_stat.st_mtime_ns
+
+    def store_file(self, key, file_path, file_stat, on_stored):
+        chunk_ids = []
+        new_chunks = 0
+        with open(file_path, 'rb') as f:
+            for chunk in read_chunks(f):
+                chunk_id = hashlib.sha256(chunk).hexdigest()
+                if self.write_chunk(chunk_id, chunk):
+                    new_chunks += 1
+                chunk_ids.append(chunk_id)
+                on_stored(len(chunk))
+
+        with self.lock:
+            self.manifest[key] = {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns, 'chunks': chunk_ids}
+        return f"{new_chunks} new chunks"
+
+    def chunk_path(self, chunk_id):
+        return os.path.join(self.chunks_path, chunk_id[:2], chunk_id)
+
+    def write_chunk(self, chunk_id, chunk):
+        chunk_path = self.chunk_path(chunk_id)
+        if os.path.exists(chunk_path):
+            return False
+        os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+        temp_path = f"{chunk_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(chunk)
+        os.replace(temp_path, chunk_path)  # Never leaves a partly written chunk under its final name
+        return True
+
+    def restore_file(self, key, target_path, on_restored):
+        entry = self.manifest[key]
+        with open(target_path, 'wb') as f:
+            for chunk_id in entry['chunks']:
+                with open(self.chunk_path(chunk_id), 'rb') as chunk_file:
+                    chunk = chunk_file.read()
+                f.write(chunk)
+                on_restored(len(chunk))
+        os.utime(target_path, ns=(entry['mtime_ns'], entry['mtime_ns']))
+
+    def save(self):
+        with self.lock:
+            os.makedirs(self.path, exist_ok=True)
+            temp_path = self.manifest_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(self.manifest, f)
+            os.replace(temp_path, self.manifest_path)
@@ -0,0 +1,171 @@
+import fnmatch
+import logging
+import os
+import stat
+
+from .archive import ARCHIVES_FOLDER_NAME, ArchiveStore
+from .copying import DEFAULT_BUFFER_SIZE_MB, PARTIAL_COPY_SUFFIX, FileCopier
+from .engine import (
+    DEFAULT_WORKERS, MODE_ARCHIVE, MODE_MIRROR, MODE_REPOSITORY, MODE_SNAPSHOT, QUARANTINE_FOLDER_NAME, CopyPool,
+    scan_tree
+)
+from .index import INDEX_FILE_NAME
+from .packs import PACKS_FOLDER_NAME, PackStore
+from .progress import ProgressReporter, format_size
+from .repository import REPOSITORY_FOLDER_NAME, ChunkRepository
+from .resume import RUN_JOURNAL_FILE_NAME
+from .snapshots import SNAPSHOTS_FOLDER_NAME, list_snapshots
+
+
+def matches(key, patterns):
+    # A pattern selects the paths it matches and everything inside the folders it matches
+    for pattern in patterns:
+        if fnmatch.fnmatch(key, pattern) or fnmatch.fnmatch(key, pattern.rstrip('/\\') + '/*'):
+            return True
+    return False
+
+
+class RestoreEngine(ProgressReporter):
+    # Qt-free restore of the files backed up to destination_folder in the given mode,
+    # either to their original locations (the backed up items) or below target_folder.
+    # In snapshot mode the named snapshot is restored, or the latest one.
+    # Files are restored on a pool of workers, largest first, using the same copy
+    # backends as the backup; files whose target already matches are left alone.
+    def __init__(self, destination_folder, items=(), target_folder=None, patterns=(), workers=DEFAULT_WORKERS,
+                 mode=MODE_MIRROR, buffer_size_mb=DEFAULT_BUFFER_SIZE_MB, snapshot=None,
+                 on_progress=None, on_throughput=None, on_status=None):
+        super().__init__(on_progress, on_throughput, on_status)
+        self.destination_folder = destination_folder
+        self.original_items = {os.path.basename(item): item for item in items}
+        self.target_folder = target_folder
+        self.patterns = patterns
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.copier = FileCopier(buffer_size_mb)
+        self.snapshot = snapshot
+        self.source_folder = destination_folder  # Folder holding the plain copies in mirror and snapshot mode
+        self.store = None
+
+    def run(self):
+        self.pool = CopyPool(self.workers)
+        try:
+            self.on_status(f"Reading backup in {self.destination_folder}...")
+            files = self.list_files()
+            selected = [(key,) + entry for key, entry in files.items()
+                        if not self.patterns or matches(key, self.patterns)]
+            # Largest first, so no big file is left running alone at the end
+            selected.sort(key=lambda file: file[1], reverse=True)
+            total_bytes = sum(size for _, size, _, _ in selected)
+            self.start_progress(len(selected), total_bytes,
+                                f"Found {len(selected)} files ({format_size(total_bytes)}) to restore")
+
+            created_folders = set()
+            for key, size, mtime_ns, restore in selected:
+                target_path = self.target_path(key)
+                try:
+                    if target_path is None:
+                        raise FileNotFoundError("No original location, choose a folder to restore to")
+                    folder = os.path.dirname(target_path)
+                    if folder not in created_folders:
+                        os.makedirs(folder, exist_ok=True)
+                        created_folders.add(folder)
+                except OSError as e:
+                    self.report_status(f"Skipped {key} ({e})", 'failed')
+                    logging.warning(f"Skipped {key} ({e})")
+                    self.advance_progress(size, 0, 1)
+                    continue
+                self.pool.submit(self.restore_file, key, target_path, size, mtime_ns, restore)
+
+            self.pool.drain()
+            self.report_status("Restore completed", force=True)
+            logging.info(f"Restore completed: {self.summary()}")
+        finally:
+            self.pool.shutdown()
+            if isinstance(self.store, ArchiveStore):
+                self.store.close()
+        return self.outcomes
+
+    def list_files(self):
+        # Maps the key of every file in the backup to (size, mtime_ns, restore function)
+        files = {}
+        if self.mode == MODE_REPOSITORY:
+            if os.path.isdir(os.path.join(self.destination_folder, REPOSITORY_FOLDER_NAME)):
+                self.store = ChunkRepository(self.destination_folder)
+                for key, entry in self.store.manifest.items():
+                    files[key] = (entry['size'], entry['mtime_ns'], self.store.restore_file)
+        elif self.mode == MODE_ARCHIVE:
+            if os.path.isdir(os.path.join(self.destination_folder, ARCHIVES_FOLDER_NAME)):
+                self.store = ArchiveStore(self.destination_folder, workers=self.workers)
+                for key, entry in self.store.catalog.items():
+                    files[key] = (entry['size'], entry['mtime_ns'], self.store.restore_file)
+        elif self.mode == MODE_SNAPSHOT:
+            snapshots_path = os.path.join(self.destination_folder, SNAPSHOTS_FOLDER_NAME)
+            snapshots = list_snapshots(snapshots_path)
+            snapshot = self.snapshot or (snapshots[-1] if snapshots else None)
+            if snapshot not in snapshots:
+                raise FileNotFoundError(f"No snapshot {snapshot or ''} in {snapshots_path}")
+            self.source_folder = os.path.join(snapshots_path, snapshot)
+            for key, entry_stat in scan_tree(self.source_folder):
+                if not stat.S_ISDIR(entry_stat.st_mode):
+                    files[key] = (entry_stat.st_size, entry_stat.st_mtime_ns, self.copy_file)
+        else:
+            for key, entry_stat in scan_tree(self.destination_folder):
+                if (key.split(os.sep)[0] in (PACKS_FOLDER_NAME, QUARANTINE_FOLDER_NAME)
+                        or key.startswith((INDEX_FILE_NAME, RUN_JOURNAL_FILE_NAME))
+                        or key.endswith(PARTIAL_COPY_SUFFIX)):
+                    continue
+                if not stat.S_ISDIR(entry_stat.st_mode):
+                    files[key] = (entry_stat.st_size, entry_stat.st_mtime_ns, self.copy_file)
+            if os.path.isdir(os.path.join(self.destination_folder, PACKS_FOLDER_NAME)):
+                # A packed entry is always the latest copy; a separate file left next to it is older
+                self.packs = PackStore(self.destination_folder)
+                for key, entry in self.packs.entries.items():
+                    if entry is not None:
+                        files[key] = (entry[2], entry[3], self.extract_packed)
+        return files
+
+    def target_path(self, key):
+        if self.target_folder:
+            return os.path.join(self.target_folder, key)
+        # The first part of every key is the name of the item it was backed up from
+        name, _, relative_path = key.partition(os.sep)
+        item = self.original_items.get(name)
+        if item is None:
+            return None
+        return os.path.join(item, relative_path) if relative_path else item
+
+    def restore_file(self, key, target_path, size, mtime_ns, restore):
+        restored = 0
+
+        def on_restored(length):
+            nonlocal restored
+            restored += length
+            self.advance_progress(length, length)
+
+        try:
+            try:
+                target_stat = os.stat(target_path)
+            except FileNotFoundError:
+                target_stat = None
+            if target_stat is not None and target_stat.st_size == size and target_stat.st_mtime_ns == mtime_ns:
+                self.report_status(f"Skipped {target_path} (No changes)", 'skipped')
+            else:
+                restore(key, target_path, on_restored)
+                self.report_status(f"Restored {key} to {target_path}", 'copied')
+                logging.info(f"Restored {key} to {target_path}")
+        except Exception as e:
+            self.report_status(f"Skipped {key} ({e})", 'failed')
+            logging.warning(f"Skipped {key} ({e})")
+        finally:
+            self.advance_progress(max(size - restored, 0), 0, 1)
+
+    def copy_file(self, key, target_path, on_restored):
+        self.copier.copy(os.path.join(self.source_folder, key), target_path, on_restored)
+
+    def extract_packed(self, key, target_path, on_restored):
+        self.packs.extract(key, target_path)
+        on_restored(self.packs.entries[key][2])
+
+    def summary(self):
+        return (f"{self.outcomes['copied']} restored, {self.outcomes['skipped']} unchanged, "
+                f"{self.outcomes['failed']} failed")
@@ -0,0 +1,137 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+RUN_JOURNAL_FILE_NAME = '.backup_run.db'  # Progress of an unfinished run, kept in the destination folder
+RUN_CHECKPOINT_INTERVAL = 10  # Seconds between saves of a run's progress
+
+
+class RunJournal:
+    # What a backup run has finished so far: whole items, and files by index key with the size and mtime
+    # they were backed up at, plus the copies under way. It is saved every RUN_CHECKPOINT_INTERVAL seconds
+    # and removed when the run ends, so a journal left behind belongs to an interrupted run, which the next
+    # run of the same target carries on instead of checking every file again.
+    def __init__(self, destination_folder, target):
+        self.path = os.path.join(destination_folder, RUN_JOURNAL_FILE_NAME)
+        self.target = target
+        self.lock = threading.Lock()
+        self.next_save = time.monotonic() + RUN_CHECKPOINT_INTERVAL
+        self.clear()
+        self.load()
+
+    def clear(self):
+        self.resumed = False
+        self.started = time.strftime('%Y-%m-%d %H:%M:%S')  # When the first of the resumed runs started
+        self.snapshot = None  # Name of the snapshot the run writes
+        self.items = set()
+        self.files = {}
+        self.interrupted_copies = []  # Keys the interrupted run was copying when it last saved
+        self.copying = set()
+        self.pending_items = []
+        self.pending_files = {}
+
+    def connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute('CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value TEXT)')
+        connection.execute('CREATE TABLE IF NOT EXISTS items (path TEXT PRIMARY KEY)')
+        connection.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER)')
+        connection.execute('CREATE TABLE IF NOT EXISTS copying (path TEXT PRIMARY KEY)')
+        return connection
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            connection = self.connect()
+            try:
+                state = dict(connection.execute('SELECT name, value FROM state'))
+                items = {path for path, in connection.execute('SELECT path FROM items')}
+                files = {path: (size, mtime_ns) for path, size, mtime_ns in connection.execute(
+                    'SELECT path, size, mtime_ns FROM files')}
+                copying = [path for path, in connection.execute('SELECT path FROM copying')]
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            logging.warning(f"Could not read the interrupted backup's progress from {self.path} ({e})")
+            self.remove()
+            return
+        if state.get('target') != self.target:
+            logging.info("Not resuming the interrupted backup, which had other items or another mode")
+            self.remove()
+            return
+        self.resumed = True
+        self.started = state.get('started', self.started)
+        self.snapshot = state.get('snapshot') or None
+        self.items = items
+        self.files = files
+        self.interrupted_copies = copying
+
+    def discard(self):
+        # Starts afresh, as if no run had been interrupted
+        self.clear()
+        self.remove()
+
+    def is_done(self, key, file_stat):
+        # Files changed since the interrupted run backed them up are backed up again
+        return self.files.get(key) == (file_stat.st_size, file_stat.st_mtime_ns)
+
+    def is_item_done(self, item):
+        return item in self.items
+
+    def start_copy(self, key):
+        with self.lock:
+            self.copying.add(key)
+
+    def end_file(self, key, file_stat=None):
+        # Called for every file the run got to, with its stat once it is backed up
+        with self.lock:
+            self.copying.discard(key)
+            if file_stat is not None:
+                self.files[key] = self.pending_files[key] = (file_stat.st_size, file_stat.st_mtime_ns)
+
+    def finish_item(self, item):
+        with self.lock:
+            self.items.add(item)
+            self.pending_items.append(item)
+
+    def save_due(self):
+        # True for one caller every RUN_CHECKPOINT_INTERVAL seconds, which then saves
+        with self.lock:
+            if time.monotonic() < self.next_save:
+                return False
+            self.next_save = time.monotonic() + RUN_CHECKPOINT_INTERVAL
+            return True
+
+    def save(self):
+        with self.lock:
+            items, files, copying = self.pending_items, self.pending_files, list(self.copying)
+            self.pending_items, self.pending_files = [], {}
+        if not (items or files or copying or self.snapshot) and not os.path.exists(self.path):
+            return  # Nothing backed up yet, and no partial snapshot to carry on
+        try:
+            connection = self.connect()
+            try:
+                with connection:
+                    connection.executemany('INSERT OR REPLACE INTO state VALUES (?, ?)',
+                                           [('target', self.target), ('started', self.started),
+                                            ('snapshot', self.snapshot or '')])
+                    connection.executemany('INSERT OR REPLACE INTO items VALUES (?)', [(item,) for item in items])
+                    connection.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?)',
+                                           [(path,) + state for path, state in files.items()])
+                    connection.execute('DELETE FROM copying')
+                    connection.executemany('INSERT INTO copying VALUES (?)', [(path,) for path in copying])
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            logging.warning(f"Failed to save the backup's progress to {self.path} ({e})")
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Failed to remove {self.path} ({e})")
@@ -0,0 +1,136 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .snapshots import PARTIAL_SUFFIX, SNAPSHOT_NAME_FORMAT, SNAPSHOTS_FOLDER_NAME, list_snapshots
+
+
+# Retention rules: keep the newest snapshot in each of the latest N periods, where a
+# period is the strftime of this format ('last' keeps the latest N snapshots)
+RETENTION_RULES = {
+    'last': None,
+    'hourly': '%Y-%m-%d %H',
+    'daily': '%Y-%m-%d',
+    'weekly': '%G-%V',
+    'monthly': '%Y-%m',
+    'yearly': '%Y',
+}
+PRUNING_PREFIX = '.prune-'  # Snapshots are renamed to this before their contents are deleted
+DELETE_BATCH_SIZE = 500  # Files unlinked per task on the delete pool
+
+
+def parse_retention(text):
+    # "last=5 daily=7 monthly=12" -> {'last': 5, 'daily': 7, 'monthly': 12}; empty keeps everything
+    policy = {}
+    for part in text.replace(',', ' ').split():
+        rule, _, count = part.partition('=')
+        if rule not in RETENTION_RULES or not count.isdigit():
+            raise ValueError(f"Invalid retention rule: {part} (use {'/'.join(RETENTION_RULES)}=COUNT)")
+        policy[rule] = int(count)
+    return policy
+
+
+def snapshot_time(name):
+    # Names are the snapshot's date, with "-2", "-3"... added for runs in the same second
+    for date in (name, name.rsplit('-', 1)[0]):
+        try:
+            return time.strptime(date, SNAPSHOT_NAME_FORMAT)
+        except ValueError:
+            pass
+    return None
+
+
+def select_snapshots(names, policy):
+    # Works only from the snapshot names, newest first; returns the names to keep. The newest
+    # snapshot (the one the next run links against) and names that are not dates are always kept.
+    keep = {name for name in names if snapshot_time(name) is None}
+    dated = sorted(((name, snapshot_time(name)) for name in names if name not in keep), reverse=True)
+    keep.update(name for name, _ in dated[:max(1, policy.get('last', 0))])
+    for rule, period_format in RETENTION_RULES.items():
+        count = policy.get(rule, 0)
+        if period_format is None or not count:
+            continue
+        periods = set()
+        for name, taken in dated:
+            period = time.strftime(period_format, taken)
+            if period not in periods:
+                periods.add(period)
+                keep.add(name)
+                if len(periods) == count:
+                    break
+    return keep
+
+
+class SnapshotPruner:
+    # Deletes the snapshots the retention policy does not keep. Each one is first renamed out
+    # of the snapshot list, so an interrupted prune never leaves a half-deleted snapshot that
+    # looks complete, and its files are then unlinked in batches on a pool of threads.
+    # Unfinished snapshots older than the newest finished one are deleted as well: only the
+    # latest run can be resumed, so nothing will ever finish them.
+    def __init__(self, destination_folder, policy, workers=1, on_status=None):
+        self.path = os.path.join(destination_folder, SNAPSHOTS_FOLDER_NAME)
+        self.policy = policy
+        self.workers = max(1, workers)
+        self.on_status = on_status or (lambda status: None)
+
+    def plan(self):
+        snapshots = list_snapshots(self.path)
+        if not self.policy:
+            return []
+        keep = select_snapshots(snapshots, self.policy)
+        return [name for name in snapshots if name not in keep]
+
+    def abandoned(self):
+        # Folder names of the unfinished snapshots started before the newest finished one
+        dated = [name for name in list_snapshots(self.path) if snapshot_time(name) is not None]
+        if not dated:
+            return []
+        newest = max(dated)
+        return sorted(name for name in os.listdir(self.path)
+                      if name.endswith(PARTIAL_SUFFIX) and snapshot_time(name[:-len(PARTIAL_SUFFIX)]) is not None
+                      and name[:-len(PARTIAL_SUFFIX)] < newest)
+
+    def run(self):
+        pruned = self.plan()
+        if not os.path.isdir(self.path):
+            return pruned  # No snapshot taken yet
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for name in pruned:
+                pruning_path = os.path.join(self.path, PRUNING_PREFIX + name)
+                os.replace(os.path.join(self.path, name), pruning_path)
+                self.on_status(f"Pruning snapshot {name}...")
+                self.delete_tree(pruning_path, executor)
+                logging.info(f"Pruned snapshot {name}")
+            for name in self.abandoned():
+                pruning_path = os.path.join(self.path, PRUNING_PREFIX + name)
+                os.replace(os.path.join(self.path, name), pruning_path)
+                self.on_status(f"Deleting unfinished snapshot {name}...")
+                self.delete_tree(pruning_path, executor)
+                logging.info(f"Deleted unfinished snapshot {name}")
+            for name in os.listdir(self.path):
+                if name.startswith(PRUNING_PREFIX):  # Left over from an interrupted prune
+                    self.delete_tree(os.path.join(self.path, name), executor)
+                    logging.info(f"Pruned snapshot {name[len(PRUNING_PREFIX):]}")
+        return pruned
+
+    def delete_tree(self, path, executor):
+        folders = []
+        files = []
+        for folder, _, names in os.walk(path, topdown=False):  # Contents before their folders
+            folders.append(folder)
+            files.extend(os.path.join(folder, name) for name in names)
+        batches = [files[start:start + DELETE_BATCH_SIZE] for start in range(0, len(files), DELETE_BATCH_SIZE)]
+        list(executor.map(self.delete_files, batches))
+        for folder in folders:
+            try:
+                os.rmdir(folder)
+            except OSError as e:
+                logging.warning(f"Failed to delete {folder} ({e})")
+
+    def delete_files(self, paths):
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError as e:
+                logging.warning(f"Failed to delete {path} ({e})")
@@ -0,0 +1,175 @@
+import datetime
+import logging
+import os
+import re
+import threading
+
+from .config import engine_settings, journal_file
+from .engine import BackupEngine
+
+
+SCHEDULE_DAYS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+SCHEDULE_DAY_GROUPS = {'daily': range(7), 'weekdays': range(5), 'weekends': range(5, 7)}
+SCHEDULE_UNITS = {'m': 60, 'h': 3600}  # Seconds per unit of 'every' schedules
+DEFAULT_MAX_PER_DESTINATION = 1  # Backups running at once to destinations on the same device
+MAX_WAIT_SECONDS = 60  # Longest the scheduler sleeps before looking at the clock again
+
+
+class Schedule:
+    # Either a fixed interval, or times of day on some days of the week
+    def __init__(self, interval=None, days=(), times=()):
+        self.interval = interval
+        self.days = set(days)
+        self.times = sorted(times)
+
+    def next_run(self, after):
+        if self.interval is not None:
+            return after + self.interval
+        for day_offset in range(8):
+            day = after.date() + datetime.timedelta(days=day_offset)
+            if day.weekday() not in self.days:
+                continue
+            for time_of_day in self.times:
+                run_at = datetime.datetime.combine(day, time_of_day)
+                if run_at > after:
+                    return run_at
+        return None
+
+
+def parse_schedule(text):
+    # "every 30m" or "every 6h"; days and times such as "daily 02:00", "weekdays 12:00,18:00"
+    # or "sat,sun 09:30"; None for an empty schedule, which leaves the profile to manual runs
+    words = text.split()
+    if not words:
+        return None
+    if words[0] == 'every':
+        match = re.fullmatch(r'(\d+)([mh])', words[1]) if len(words) == 2 else None
+        if match is None or int(match.group(1)) == 0:
+            raise ValueError(f"Invalid schedule: {text} (use e.g. 'every 30m' or 'every 6h')")
+        return Schedule(interval=datetime.timedelta(seconds=int(match.group(1)) * SCHEDULE_UNITS[match.group(2)]))
+
+    if len(words) != 2:
+        raise ValueError(f"Invalid schedule: {text} (use e.g. 'daily 02:00' or 'mon,thu 18:30')")
+    day_names, time_names = words
+    days = set()
+    for name in day_names.lower().split(','):
+        if name in SCHEDULE_DAY_GROUPS:
+            days.update(SCHEDULE_DAY_GROUPS[name])
+        elif name in SCHEDULE_DAYS:
+            days.add(SCHEDULE_DAYS[name])
+        else:
+            raise ValueError(f"Invalid schedule day: {name} (use {'/'.join(SCHEDULE_DAY_GROUPS)} or "
+                             f"{','.join(SCHEDULE_DAYS)})")
+    times = []
+    for name in time_names.split(','):
+        try:
+            times.append(datetime.datetime.strptime(name, '%H:%M').time())
+        except ValueError:
+            raise ValueError(f"Invalid schedule time: {name} (use HH:MM)")
+    return Schedule(days=days, times=times)
+
+
+def destination_device(folder):
+    # Destinations on the same device, such as folders on one NAS share, share a concurrency limit
+    path = os.path.abspath(folder)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)  # Not created before the first backup
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return path
+
+
+class BackupScheduler:
+    # Backs up every profile with a schedule whenever it is due, each on its own thread, running at most
+    # max_per_destination backups at once to destinations on the same device; the others wait their turn.
+    # A profile that is due again while its last backup still runs or waits is skipped that time.
+    def __init__(self, profiles, max_per_destination=DEFAULT_MAX_PER_DESTINATION, on_status=None):
+        self.profiles = {}
+        self.schedules = {}
+        for name, config in profiles.items():
+            try:
+                schedule = parse_schedule(config['schedule'])
+            except ValueError as e:
+                raise ValueError(f"{e} in profile {name}")
+            if schedule is None:
+                continue
+            if not config['destination_folder'] or not config['items']:
+                logging.warning(f"Not scheduling profile {name}, which has no destination or items")
+                continue
+            BackupEngine(config['items'], config['destination_folder'], **engine_settings(config))  # Check settings
+            self.profiles[name] = config
+            self.schedules[name] = schedule
+        self.max_per_destination = max(1, max_per_destination)
+        self.on_status = on_status or (lambda message: None)
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.next_runs = {}
+        self.waiting = []  # Due profiles, oldest first
+        self.running = {}  # Profile -> (thread, destination device)
+
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify()
+
+    def run(self):
+        now = datetime.datetime.now()
+        for name, schedule in self.schedules.items():
+            self.next_runs[name] = schedule.next_run(now)
+            self.on_status(f"Profile {name}: next backup at {self.next_runs[name]:%Y-%m-%d %H:%M}")
+        try:
+            with self.condition:
+                while not self.stop_event.is_set():
+                    self.queue_due(datetime.datetime.now())
+                    self.start_waiting()
+                    upcoming = [run_at for run_at in self.next_runs.values() if run_at is not None]
+                    wait = MAX_WAIT_SECONDS
+                    if upcoming:
+                        wait = min(wait, max(0.0, (min(upcoming) - datetime.datetime.now()).total_seconds()))
+                    self.condition.wait(wait)
+        finally:
+            # Backups that already started are finished rather than left half done
+            for thread, _ in list(self.running.values()):
+                thread.join()
+
+    def queue_due(self, now):
+        for name, run_at in self.next_runs.items():
+            if run_at is None or run_at > now:
+                continue
+            self.next_runs[name] = self.schedules[name].next_run(now)
+            if name in self.running or name in self.waiting:
+                self.on_status(f"Skipped profile {name}, its last backup has not finished")
+                logging.warning(f"Skipped profile {name}, its last backup has not finished")
+            else:
+                self.waiting.append(name)
+
+    def start_waiting(self):
+        for name in list(self.waiting):
+            device = destination_device(self.profiles[name]['destination_folder'])
+            if sum(1 for _, running_device in self.running.values() if running_device == device) \
+                    >= self.max_per_destination:
+                continue
+            self.waiting.remove(name)
+            thread = threading.Thread(target=self.back_up, args=(name,))
+            self.running[name] = (thread, device)
+            thread.start()
+
+    def back_up(self, name):
+        config = self.profiles[name]
+        try:
+            self.on_status(f"Started profile {name}")
+            logging.info(f"Started profile {name}")
+            engine = BackupEngine(config['items'], config['destination_folder'], **engine_settings(config),
+                                  journal_file=journal_file(name))
+            engine.run()
+            message = f"Finished profile {name}: {engine.summary()}"
+            self.on_status(message)
+            logging.info(message)
+        except Exception as e:
+            self.on_status(f"Profile {name} failed ({e})")
+            logging.error(f"Profile {name} failed ({e})")
+        finally:
+            with self.condition:
+                del self.running[name]
+                self.condition.notify()
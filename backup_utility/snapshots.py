@@ -0,0 +1,70 @@
+import os
+import time
+
+
+SNAPSHOTS_FOLDER_NAME = 'snapshots'
+SNAPSHOT_NAME_FORMAT = '%Y-%m-%d_%H%M%S'  # Snapshot folder names sort by the time they were taken
+PARTIAL_SUFFIX = '.partial'  # Added to the snapshot being written until its run ends
+
+
+def list_snapshots(snapshots_path):
+    # Names of the finished snapshots, oldest first
+    try:
+        names = os.listdir(snapshots_path)
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names
+                  if not name.startswith('.') and not name.endswith(PARTIAL_SUFFIX)
+                  and os.path.isdir(os.path.join(snapshots_path, name)))
+
+
+class SnapshotStore:
+    # Every run writes a new dated folder under snapshots/. Files that did not change
+    # since the previous snapshot are hard-linked to it instead of copied, so each
+    # snapshot is complete but only costs the changed files plus folder entries.
+    # Passing the name of a snapshot an interrupted run left unfinished carries on writing it.
+    def __init__(self, destination_folder, resume_name=None):
+        self.path = os.path.join(destination_folder, SNAPSHOTS_FOLDER_NAME)
+        snapshots = list_snapshots(self.path)
+        self.previous_path = os.path.join(self.path, snapshots[-1]) if snapshots else None
+        if resume_name is not None and os.path.isdir(os.path.join(self.path, resume_name + PARTIAL_SUFFIX)):
+            self.name = resume_name
+        else:
+            self.name = self.new_snapshot_name()
+        self.partial_path = os.path.join(self.path, self.name + PARTIAL_SUFFIX)
+
+    def start(self):
+        os.makedirs(self.partial_path, exist_ok=True)
+
+    def new_snapshot_name(self):
+        stem = time.strftime(SNAPSHOT_NAME_FORMAT)
+        name = stem
+        number = 1
+        while (os.path.exists(os.path.join(self.path, name))
+               or os.path.exists(os.path.join(self.path, name + PARTIAL_SUFFIX))):
+            number += 1
+            name = f"{stem}-{number}"
+        return name
+
+    def can_link(self, key, file_stat, check_mtime=True):
+        # Whether the previous snapshot has a copy that still matches the source
+        if self.previous_path is None:
+            return False
+        try:
+            previous_stat = os.stat(os.path.join(self.previous_path, key))
+        except OSError:
+            return False
+        return previous_stat.st_size == file_stat.st_size and (
+            not check_mtime or previous_stat.st_mtime_ns == file_stat.st_mtime_ns)
+
+    def link(self, key, target_path):
+        # Returns False when the file has to be copied instead (a filesystem without
+        # hard links, or the link limit reached)
+        try:
+            os.link(os.path.join(self.previous_path, key), target_path)
+        except OSError:
+            return False
+        return True
+
+    def finish(self):
+        os.replace(self.partial_path, os.path.join(self.path, self.name))
@@ -0,0 +1,164 @@
+import ctypes
+import ctypes.util
+import datetime
+import logging
+import os
+import platform
+import re
+import sys
+import threading
+import time
+
+
+BURST_SECONDS = 1.0  # Unused allowance a bucket can save up, in seconds of its rate
+MAX_SLEEP_SECONDS = 0.5  # Longest sleep before a waiting worker looks at the limits again
+REFRESH_SECONDS = 10  # How often the time-of-day rules are re-evaluated during a run
+THROTTLE_UNITS = {'B/s': 1, 'KB/s': 1024, 'MB/s': 1024 ** 2, 'GB/s': 1024 ** 3, 'ops/s': 1}
+
+LOW_PRIORITY_NICENESS = 10
+# ioprio_set(2): the lowest best-effort disk priority, like `ionice -c2 -n7`. The idle class could
+# starve a backup completely on a volume that is never idle.
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_LOWEST_LEVEL = 7
+IOPRIO_SET_SYSCALLS = {'x86_64': 251, 'aarch64': 30, 'i686': 289, 'armv7l': 314}
+
+
+def parse_throttle(text):
+    # "20MB/s 200ops/s" limits always; "08:00-18:00 20MB/s" only in that time window, wrapping past midnight
+    # when it ends before it starts. Rules separated by ';' are tried in order, a rule without a window
+    # applies where no window matches, and outside all of them copies are unlimited.
+    # Returns [(start, end, bytes per second, operations per second)], 0 meaning unlimited.
+    rules = []
+    for rule in text.split(';'):
+        words = rule.split()
+        if not words:
+            continue
+        start = end = None
+        match = re.fullmatch(r'(\d\d?:\d\d)-(\d\d?:\d\d)', words[0])
+        if match is not None:
+            try:
+                start, end = (datetime.datetime.strptime(value, '%H:%M').time() for value in match.groups())
+            except ValueError:
+                raise ValueError(f"Invalid throttle time window: {words[0]} (use HH:MM-HH:MM)")
+            words = words[1:]
+        bytes_per_second = operations_per_second = 0
+        for word in words:
+            match = re.fullmatch(r'(\d+(?:\.\d+)?)([KMG]?B/s|ops/s)', word, re.IGNORECASE)
+            if word.lower() == 'unlimited':
+                continue
+            if match is None:
+                raise ValueError(f"Invalid throttle limit: {word} (use e.g. 20MB/s, 200ops/s or unlimited)")
+            unit = next(unit for unit in THROTTLE_UNITS if unit.lower() == match.group(2).lower())
+            if unit == 'ops/s':
+                operations_per_second = float(match.group(1))
+            else:
+                bytes_per_second = float(match.group(1)) * THROTTLE_UNITS[unit]
+        rules.append((start, end, bytes_per_second, operations_per_second))
+    return rules
+
+
+def active_limits(rules, now):
+    default = (0, 0)
+    for start, end, bytes_per_second, operations_per_second in rules:
+        if start is None:
+            default = (bytes_per_second, operations_per_second)
+        elif start <= now < end if start <= end else (now >= start or now < end):
+            return bytes_per_second, operations_per_second
+    return default
+
+
+class TokenBucket:
+    # Shared by all worker threads. Taking more than is available puts the bucket in debt, and
+    # the taker waits until it is paid off, so chunks larger than the bucket still average out.
+    def __init__(self):
+        self.rate = 0  # Per second, 0 for unlimited
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self.lock:
+            if rate != self.rate:
+                self.rate = rate
+                self.tokens = min(self.tokens, rate * BURST_SECONDS)
+
+    def take(self, amount):
+        with self.lock:
+            if not self.rate:
+                return
+            self.refill()
+            self.tokens -= amount
+        while True:
+            with self.lock:
+                if not self.rate:
+                    self.tokens = 0.0  # Unlimited from now on, the debt is forgiven
+                    return
+                self.refill()
+                if self.tokens >= 0:
+                    return
+                wait = min(-self.tokens / self.rate, MAX_SLEEP_SECONDS)
+            time.sleep(wait)
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate * BURST_SECONDS, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class Throttle:
+    # Rate limits on copied bytes and file operations for one run, following the time-of-day
+    # rules of parse_throttle; set_rules replaces them while the run goes on
+    def __init__(self, rules=()):
+        self.bytes = TokenBucket()
+        self.operations = TokenBucket()
+        self.set_rules(rules)
+
+    def set_rules(self, rules):
+        self.rules = list(rules)
+        self.next_refresh = 0
+        self.refresh()
+
+    def refresh(self):
+        if time.monotonic() < self.next_refresh:
+            return
+        self.next_refresh = time.monotonic() + REFRESH_SECONDS
+        bytes_per_second, operations_per_second = active_limits(self.rules, datetime.datetime.now().time())
+        self.bytes.set_rate(bytes_per_second)
+        self.operations.set_rate(operations_per_second)
+
+    def take_bytes(self, count):
+        self.refresh()
+        self.bytes.take(count)
+
+    def take_operation(self):
+        self.refresh()
+        self.operations.take(1)
+
+
+def load_libc():
+    try:
+        return ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except OSError:
+        return None
+
+
+def lower_priority():
+    # Lowers the CPU and disk priority of the calling thread, where the OS allows it per thread (Linux)
+    if not sys.platform.startswith('linux'):
+        return
+    thread_id = threading.get_native_id()
+    try:
+        niceness = os.getpriority(os.PRIO_PROCESS, thread_id)
+        if niceness < LOW_PRIORITY_NICENESS:
+            os.setpriority(os.PRIO_PROCESS, thread_id, LOW_PRIORITY_NICENESS)
+    except OSError as e:
+        logging.warning(f"Could not lower the CPU priority ({e})")
+    syscall = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    libc = load_libc()
+    if syscall is None or libc is None:
+        return
+    priority = (IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT) | IOPRIO_LOWEST_LEVEL
+    if libc.syscall(syscall, IOPRIO_WHO_PROCESS, 0, priority) < 0:
+        logging.warning(f"Could not lower the disk priority ({os.strerror(ctypes.get_errno())})")